@@ -0,0 +1,129 @@
+import argparse, json, platform, sys, time
+import numpy as np
+from track_generator import TrackGenerator
+from utils import Mode
+
+# Benchmark grid, (n_points, n_regions) per mode
+grid = [(20, 10), (40, 20), (100, 30)]
+min_bound = 0
+max_bound = 250
+
+def run_config(mode, n_points, n_regions, seeds):
+    """
+    Generates one track per seed and collects throughput and generation statistics.
+
+    Args:
+        mode (Mode): Region selection mode.
+        n_points (int): Number of points of the Voronoi diagram.
+        n_regions (int): Number of regions to select.
+        seeds (list): Seeds of the tracks.
+
+    Returns:
+        dict: Tracks per second, number of failed tracks, distributions of attempts and spline fits, mean time per stage and rejections per reason.
+    """
+    attempts, spline_fits, stage_times, rejections = [], [], {}, {}
+    n_failed = 0
+
+    start = time.perf_counter()
+    for seed in seeds:
+        track_gen = TrackGenerator(n_points, n_regions, min_bound, max_bound, mode, False, False, False, '/', seed=seed, collect_stats=True)
+        try:
+            track_gen.create_track()
+        except Exception:
+            n_failed += 1
+            continue
+        attempts.append(track_gen.stats.attempts)
+        spline_fits.append(track_gen.stats.spline_fits)
+        for stage, stage_time in track_gen.stats.stage_times.items():
+            stage_times.setdefault(stage, []).append(stage_time)
+        for reason, count in track_gen.stats.rejections.items():
+            rejections[reason] = rejections.get(reason, 0) + count
+    duration = time.perf_counter() - start
+
+    return {
+        'tracks_per_sec': len(attempts) / duration,
+        'n_tracks': len(attempts),
+        'n_failed': n_failed,
+        'attempts': distribution(attempts),
+        'spline_fits': distribution(spline_fits),
+        'stage_times': {stage: float(np.mean(times)) for stage, times in stage_times.items()},
+        'rejections': rejections,
+    }
+
+def distribution(values):
+    """
+    Summarises a list of values.
+
+    Args:
+        values (list): Values to summarise.
+
+    Returns:
+        dict: Mean, median, 90th percentile and maximum, or None if there are no values.
+    """
+    if not values:
+        return None
+    return {
+        'mean': float(np.mean(values)),
+        'p50': float(np.percentile(values, 50)),
+        'p90': float(np.percentile(values, 90)),
+        'max': float(np.max(values)),
+    }
+
+def compare(results, baseline, threshold):
+    """
+    Compares throughput to a baseline.
+
+    Args:
+        results (dict): Benchmark results per configuration.
+        baseline (dict): Baseline results per configuration.
+        threshold (float): Maximum allowed relative decrease in tracks per second.
+
+    Returns:
+        list: Descriptions of the configurations that regressed.
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline or not baseline[key]['tracks_per_sec']:
+            continue
+        change = result['tracks_per_sec'] / baseline[key]['tracks_per_sec'] - 1
+        print("{:<20} {:+7.1%}".format(key, change))
+        if change < -threshold:
+            regressions.append("{}: {:.1f} -> {:.1f} tracks/s".format(key, baseline[key]['tracks_per_sec'], result['tracks_per_sec']))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark track generation throughput.")
+    parser.add_argument('--seeds', type=int, default=50, help="Number of seeded tracks per configuration.")
+    parser.add_argument('--modes', nargs='+', default=[mode.name for mode in Mode], choices=[mode.name for mode in Mode])
+    parser.add_argument('--output', default='benchmark.json', help="JSON file to write the results to.")
+    parser.add_argument('--baseline', default=None, help="JSON file of a previous run to compare against.")
+    parser.add_argument('--threshold', type=float, default=0.1, help="Maximum allowed relative decrease in tracks per second.")
+    args = parser.parse_args()
+
+    seeds = range(args.seeds)
+    results = {}
+    print("{:<20} {:>10} {:>8} {:>10} {:>10}".format('config', 'tracks/s', 'failed', 'attempts', 'fits'))
+    for mode_name in args.modes:
+        for n_points, n_regions in grid:
+            key = "{}/{}/{}".format(mode_name, n_points, n_regions)
+            result = run_config(Mode[mode_name], n_points, n_regions, seeds)
+            results[key] = result
+            print("{:<20} {:>10.1f} {:>8} {:>10.2f} {:>10.2f}".format(
+                key, result['tracks_per_sec'], result['n_failed'],
+                result['attempts']['mean'] if result['attempts'] else float('nan'),
+                result['spline_fits']['mean'] if result['spline_fits'] else float('nan')))
+
+    with open(args.output, 'w') as outfile:
+        json.dump({'python': platform.python_version(), 'numpy': np.__version__, 'seeds': args.seeds, 'results': results}, outfile, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as infile:
+            baseline = json.load(infile)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("Regressions above {:.0%}:".format(args.threshold))
+            print("\n".join(regressions))
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
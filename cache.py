@@ -0,0 +1,191 @@
+import hashlib, json, os
+from enum import Enum
+import numpy as np
+
+# Bump when the generated tracks change in a way the source fingerprint does not capture
+ALGORITHM_VERSION = 1
+
+# Source files of the generation algorithm, any change to them invalidates the cache
+ALGORITHM_FILES = ('track_generator.py', 'track.py', 'utils.py', 'voronoi.py')
+
+# TrackGenerator parameters that do not influence the generated cones
+# The feasibility options can change the number of points and regions, which are hashed after the adjustment instead
+IGNORED_PARAMS = {'plot_track', 'visualise_voronoi', 'create_output_file', 'output_location', 'output_name',
+                  'sim_type', 'z_offset', 'lat_offset', 'lon_offset', 'collect_stats', 'stats_hook',
+                  'feasibility_map', 'min_acceptance', 'adjust_infeasible'}
+
+_fingerprint = None
+
+def algorithm_fingerprint():
+    """
+    Returns a hash of the algorithm version and the source of the generation algorithm.
+    Computed once per process.
+
+    Returns:
+        str: Hex digest of the fingerprint.
+    """
+    global _fingerprint
+    if _fingerprint is None:
+        digest = hashlib.sha256(str(ALGORITHM_VERSION).encode())
+        directory = os.path.dirname(os.path.realpath(__file__))
+        for file_name in ALGORITHM_FILES:
+            with open(os.path.join(directory, file_name), 'rb') as infile:
+                digest.update(infile.read())
+        _fingerprint = digest.hexdigest()
+    return _fingerprint
+
+def _effective_params(params):
+    """
+    Returns the parameters with the number of points and regions that the generator uses,
+    after adjusting an infeasible configuration with its feasibility map.
+    """
+    feasibility_map = params.get('feasibility_map')
+    if feasibility_map is None or not params.get('adjust_infeasible', False):
+        return params
+    # Same default minimum acceptance rate as TrackGenerator
+    n_points, n_regions = feasibility_map.adjusted(params['mode'], params['n_points'], params['n_regions'],
+                                                   params['min_bound'], params['max_bound'], params.get('min_acceptance', 0.05))
+    return dict(params, n_points=n_points, n_regions=n_regions)
+
+class TrackCache:
+    """
+    Content-addressed on-disk cache of generated tracks.
+    Tracks are stored by a hash of the generation parameters, the seed and the algorithm fingerprint.
+    The least recently used tracks are evicted when the cache exceeds its size or number of entries.
+    Reading a cached track does not import the generation algorithm or its dependencies.
+    """
+
+    def __init__(self, directory, max_bytes=None, max_entries=None):
+        """
+        Args:
+            directory (str): Directory of the cache, created if it does not exist.
+            max_bytes (int): Maximum total size of the cached tracks in bytes. If None, the size is not limited.
+            max_entries (int): Maximum number of cached tracks. If None, the number is not limited.
+        """
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, params, seed):
+        """
+        Args:
+            params (dict): Keyword arguments of the TrackGenerator constructor.
+            seed (int): Seed of the track.
+
+        Returns:
+            str: Hash that identifies the track.
+
+        Raises:
+            ValueError: If a relevant parameter is not JSON serialisable, e.g. a start_rule function, as it would not hash the same in every process.
+        """
+        relevant = {name: value.name if isinstance(value, Enum) else value
+                    for name, value in _effective_params(params).items() if name not in IGNORED_PARAMS and name != 'seed'}
+        try:
+            content = json.dumps({'params': relevant, 'seed': int(seed), 'algorithm': algorithm_fingerprint()}, sort_keys=True)
+        except TypeError as e:
+            raise ValueError("Parameters cannot be cached: {}".format(e))
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def get(self, params, seed):
+        """
+        Returns a cached track.
+
+        Args:
+            params (dict): Keyword arguments of the TrackGenerator constructor.
+            seed (int): Seed of the track.
+
+        Returns:
+            tuple: Left cones, right cones and metadata of the track, or None if the track is not cached.
+        """
+        path = self._path(self.key(params, seed))
+        try:
+            with np.load(path) as data:
+                cones_left, cones_right = data['cones_left'], data['cones_right']
+                metadata = json.loads(str(data['metadata']))
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+        # Mark as recently used
+        os.utime(path)
+        return cones_left, cones_right, metadata
+
+    def put(self, params, seed, cones_left, cones_right, metadata=None):
+        """
+        Stores a track, then evicts the least recently used tracks if the cache is too large.
+
+        Args:
+            params (dict): Keyword arguments of the TrackGenerator constructor.
+            seed (int): Seed of the track.
+            cones_left (numpy.ndarray): Nx2 numpy array of left cone coordinates.
+            cones_right (numpy.ndarray): Nx2 numpy array of right cone coordinates.
+            metadata (dict): JSON serialisable metadata of the track.
+        """
+        path = self._path(self.key(params, seed))
+
+        # Write to a temporary file first, so that concurrent readers never see a partial track
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as outfile:
+            np.savez(outfile, cones_left=cones_left, cones_right=cones_right, metadata=json.dumps(metadata or {}))
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def get_or_create(self, params, seed):
+        """
+        Returns a cached track, or generates and caches it if it is not cached.
+
+        Args:
+            params (dict): Keyword arguments of the TrackGenerator constructor, output options are ignored.
+            seed (int): Seed of the track.
+
+        Returns:
+            tuple: Left cones, right cones and metadata of the track.
+        """
+        cached = self.get(params, seed)
+        if cached is not None:
+            return cached
+
+        # Only import the generator on a miss
+        from track_generator import TrackGenerator
+        track_params = dict(params, plot_track=False, visualise_voronoi=False, create_output_file=False, seed=seed)
+        track_gen = TrackGenerator(**track_params)
+        track_gen.create_track()
+
+        metadata = track_gen.metadata()
+        self.put(params, seed, track_gen.cones_left, track_gen.cones_right, metadata)
+        return track_gen.cones_left, track_gen.cones_right, metadata
+
+    def evict(self):
+        """
+        Removes the least recently used tracks until the cache is within its limits.
+        """
+        if self._max_bytes is None and self._max_entries is None:
+            return
+
+        entries = []
+        for entry in os.scandir(self._directory):
+            if entry.name.endswith('.npz'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        total_bytes = sum(size for _, size, _ in entries)
+        while entries and ((self._max_bytes is not None and total_bytes > self._max_bytes) or
+                           (self._max_entries is not None and len(entries) > self._max_entries)):
+            _, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+    def clear(self):
+        """
+        Removes all cached tracks.
+        """
+        for entry in os.scandir(self._directory):
+            if entry.name.endswith('.npz'):
+                os.remove(entry.path)
+
+    def _path(self, key):
+        return os.path.join(self._directory, key + '.npz')
@@ -0,0 +1,171 @@
+import contextlib, os
+import numpy as np
+from utils import Mode
+
+# File locks for processes appending to the same dataset, not available on Windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# One record per track in the index file, offset and counts are in cones
+INDEX_DTYPE = np.dtype([
+    ('offset', '<i8'),
+    ('n_left', '<i4'),
+    ('n_right', '<i4'),
+    ('seed', '<i8'),
+    ('mode', '<i1'),
+    ('n_points', '<i4'),
+    ('n_regions', '<i4'),
+    ('length', '<f4'),
+])
+
+def _dataset_paths(directory, name):
+    return os.path.join(directory, name + '.cones'), os.path.join(directory, name + '.index')
+
+class TrackDatasetWriter:
+    """
+    Appends tracks to a compact binary dataset.
+    The dataset consists of two files: a flat float32 array of all cone coordinates and an index with one record per track.
+    For every track the left cones are stored first, followed by the right cones.
+    Several processes can append to the same dataset, every append locks the index file (not on Windows, where only one process may write).
+    """
+
+    def __init__(self, directory, name='tracks'):
+        """
+        Args:
+            directory (str): Directory of the dataset.
+            name (str): Name of the dataset files, without extension.
+        """
+        cones_path, index_path = _dataset_paths(directory, name)
+        self._cones_file = open(cones_path, 'ab')
+        self._index_file = open(index_path, 'ab')
+
+    def append(self, cones_left, cones_right, metadata=None):
+        """
+        Appends a track to the dataset.
+
+        Args:
+            cones_left (numpy.ndarray): Nx2 numpy array of left cone coordinates.
+            cones_right (numpy.ndarray): Nx2 numpy array of right cone coordinates.
+            metadata (dict): Metadata of the track, seed, mode, n_points, n_regions and length are stored.
+                The length is calculated from the cones if it is not given.
+
+        Returns:
+            int: Offset of the track in the cone array.
+        """
+        metadata = metadata or {}
+        cones = np.concatenate([cones_left, cones_right]).astype('<f4')
+        length = metadata.get('length')
+        if length is None:
+            length = (_ring_length(cones_left) + _ring_length(cones_right)) / 2
+
+        record = np.zeros(1, dtype=INDEX_DTYPE)
+        record['n_left'] = len(cones_left)
+        record['n_right'] = len(cones_right)
+        record['seed'] = -1 if metadata.get('seed') is None else metadata['seed']
+        record['mode'] = Mode[metadata['mode']].value if 'mode' in metadata else 0
+        record['n_points'] = metadata.get('n_points', 0)
+        record['n_regions'] = metadata.get('n_regions', 0)
+        record['length'] = length
+
+        # Other processes may have appended since the dataset was opened, so the offset is read under the lock
+        with _locked(self._index_file):
+            offset = os.fstat(self._cones_file.fileno()).st_size // (2 * cones.itemsize)
+            record['offset'] = offset
+
+            # Write the cones before the index, so the index never refers to missing cones
+            self._cones_file.write(cones.tobytes())
+            self._cones_file.flush()
+            self._index_file.write(record.tobytes())
+            self._index_file.flush()
+        return offset
+
+    def close(self):
+        self._cones_file.close()
+        self._index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class TrackDataset:
+    """
+    Memory-mapped reader of a binary track dataset written by TrackDatasetWriter.
+    Tracks are returned as views on the memory-mapped cone array, nothing is copied.
+
+    Attributes:
+        index (numpy.ndarray): Index record of every track, see INDEX_DTYPE.
+    """
+
+    def __init__(self, directory, name='tracks'):
+        """
+        Args:
+            directory (str): Directory of the dataset.
+            name (str): Name of the dataset files, without extension.
+        """
+        cones_path, index_path = _dataset_paths(directory, name)
+        self.index = _memmap(index_path, INDEX_DTYPE)
+        self._cones = _memmap(cones_path, np.dtype('<f4')).reshape(-1, 2)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        """
+        Args:
+            i (int): Index of the track.
+
+        Returns:
+            tuple: Nx2 float32 views of the left and right cone coordinates.
+        """
+        record = self.index[i]
+        start, n_left, n_right = int(record['offset']), int(record['n_left']), int(record['n_right'])
+        return self._cones[start:start + n_left], self._cones[start + n_left:start + n_left + n_right]
+
+    def metadata(self, i):
+        """
+        Args:
+            i (int): Index of the track.
+
+        Returns:
+            dict: Seed, mode, n_points, n_regions and length of the track.
+        """
+        record = self.index[i]
+        return {
+            'seed': None if record['seed'] < 0 else int(record['seed']),
+            'mode': Mode(int(record['mode'])).name if record['mode'] else None,
+            'n_points': int(record['n_points']),
+            'n_regions': int(record['n_regions']),
+            'length': float(record['length']),
+        }
+
+@contextlib.contextmanager
+def _locked(file):
+    """
+    Holds an exclusive lock on an open file, if file locks are available.
+    """
+    if fcntl is None:
+        yield
+        return
+    fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+def _memmap(path, dtype):
+    """
+    Memory-maps a file as a read-only array, an empty file results in an empty array.
+    """
+    if os.path.getsize(path) < dtype.itemsize:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(os.path.getsize(path) // dtype.itemsize,))
+
+def _ring_length(points):
+    """
+    Returns the length of the closed polyline through the points.
+    """
+    return float(np.sum(np.linalg.norm(np.diff(points, axis=0, append=points[:1]), axis=1)))
@@ -0,0 +1,194 @@
+import argparse, itertools, json
+import numpy as np
+from track_generator import TrackGenerator
+from utils import Mode
+
+# Default parameter grid of the sweep
+n_points_grid = [10, 20, 40, 80]
+n_regions_grid = [3, 5, 10, 20, 40]
+bounds_grid = [(0, 250)]
+
+def profile_config(mode, n_points, n_regions, min_bound, max_bound, seeds, workers=None, max_attempts=200, timeout=10.):
+    """
+    Measures how quickly a configuration converges, by generating one track per seed.
+
+    Args:
+        mode (Mode): Region selection mode.
+        n_points (int): Number of points of the Voronoi diagram.
+        n_regions (int): Number of regions to select.
+        min_bound (float): Minimum x and y bound of the Voronoi diagram.
+        max_bound (float): Maximum x and y bound of the Voronoi diagram.
+        seeds (list): Seeds of the tracks.
+        workers (int): Number of worker processes.
+        max_attempts (int): Maximum number of attempts per track.
+        timeout (float): Maximum time per track in seconds.
+
+    Returns:
+        dict: Configuration, acceptance rate of attempts, success rate of tracks, mean attempts and time per accepted track.
+    """
+    params = dict(n_points=n_points, n_regions=n_regions, min_bound=min_bound, max_bound=max_bound, mode=mode,
+                  plot_track=False, visualise_voronoi=False, create_output_file=False, output_location='/',
+                  collect_stats=True, max_attempts=max_attempts, timeout=timeout)
+    n_accepted, attempts, total_time = 0, [], 0.
+    for result in TrackGenerator.generate_batch(len(seeds), seeds=seeds, workers=workers, **params):
+        if result.stats is None:
+            # Failed before any statistics were collected, e.g. on invalid parameters
+            continue
+        attempts.append(result.stats['attempts'])
+        total_time += sum(result.stats['stage_times'].values())
+        if result.error is None:
+            n_accepted += 1
+
+    return {
+        'mode': mode.name,
+        'n_points': n_points,
+        'n_regions': n_regions,
+        'min_bound': min_bound,
+        'max_bound': max_bound,
+        'acceptance_rate': n_accepted / sum(attempts) if sum(attempts) else 0.,
+        'success_rate': n_accepted / len(seeds),
+        'mean_attempts': float(np.mean(attempts)) if attempts else None,
+        'time_per_track': total_time / n_accepted if n_accepted else None,
+    }
+
+def sweep(modes=tuple(Mode), n_points=n_points_grid, n_regions=n_regions_grid, bounds=bounds_grid, n_seeds=20, workers=None):
+    """
+    Profiles every configuration of a parameter grid. Configurations with more regions than points are skipped.
+
+    Args:
+        modes (list): Region selection modes.
+        n_points (list): Numbers of points of the Voronoi diagram.
+        n_regions (list): Numbers of regions to select.
+        bounds (list): Pairs of minimum and maximum bounds.
+        n_seeds (int): Number of tracks per configuration.
+        workers (int): Number of worker processes.
+
+    Returns:
+        FeasibilityMap: Profile of every configuration.
+    """
+    entries = []
+    for mode, points, regions, (min_bound, max_bound) in itertools.product(modes, n_points, n_regions, bounds):
+        if regions >= points:
+            continue
+        entries.append(profile_config(mode, points, regions, min_bound, max_bound, range(n_seeds), workers))
+    return FeasibilityMap(entries)
+
+class FeasibilityMap:
+    """
+    Lookup table of the measured convergence of parameter configurations.
+    Used by TrackGenerator to warn about or adjust configurations that rarely result in a track.
+    """
+
+    def __init__(self, entries):
+        """
+        Args:
+            entries (list): Profiles of configurations, see profile_config.
+        """
+        self.entries = list(entries)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Args:
+            path (str): JSON file written by save.
+
+        Returns:
+            FeasibilityMap: Loaded lookup table.
+        """
+        with open(path) as infile:
+            return cls(json.load(infile))
+
+    def save(self, path):
+        """
+        Args:
+            path (str): JSON file to write the lookup table to.
+        """
+        with open(path, 'w') as outfile:
+            json.dump(self.entries, outfile, indent=2)
+
+    def lookup(self, mode, n_points, n_regions, min_bound, max_bound):
+        """
+        Returns the profile of the closest measured configuration with the same mode and bounds.
+        Closeness is measured by the relative difference in number of points and regions.
+
+        Args:
+            mode (Mode): Region selection mode.
+            n_points (int): Number of points of the Voronoi diagram.
+            n_regions (int): Number of regions to select.
+            min_bound (float): Minimum x and y bound of the Voronoi diagram.
+            max_bound (float): Maximum x and y bound of the Voronoi diagram.
+
+        Returns:
+            dict: Profile of the closest configuration, or None if there is none with the same mode and bounds.
+        """
+        candidates = self._candidates(mode, min_bound, max_bound)
+        if not candidates:
+            return None
+        return min(candidates, key=lambda entry: _distance(entry, n_points, n_regions))
+
+    def closest_feasible(self, mode, n_points, n_regions, min_bound, max_bound, min_acceptance):
+        """
+        Returns the profile of the closest measured configuration with the same mode and bounds
+        that has at least the minimum acceptance rate.
+
+        Args:
+            mode (Mode): Region selection mode.
+            n_points (int): Number of points of the Voronoi diagram.
+            n_regions (int): Number of regions to select.
+            min_bound (float): Minimum x and y bound of the Voronoi diagram.
+            max_bound (float): Maximum x and y bound of the Voronoi diagram.
+            min_acceptance (float): Minimum acceptance rate.
+
+        Returns:
+            dict: Profile of the closest feasible configuration, or None if there is none.
+        """
+        candidates = [entry for entry in self._candidates(mode, min_bound, max_bound) if entry['acceptance_rate'] >= min_acceptance]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda entry: _distance(entry, n_points, n_regions))
+
+    def adjusted(self, mode, n_points, n_regions, min_bound, max_bound, min_acceptance):
+        """
+        Returns the number of points and regions to use instead of an infeasible configuration,
+        the closest feasible configuration if the acceptance rate of the closest measured one is below the minimum.
+
+        Args:
+            mode (Mode): Region selection mode.
+            n_points (int): Number of points of the Voronoi diagram.
+            n_regions (int): Number of regions to select.
+            min_bound (float): Minimum x and y bound of the Voronoi diagram.
+            max_bound (float): Maximum x and y bound of the Voronoi diagram.
+            min_acceptance (float): Minimum acceptance rate.
+
+        Returns:
+            tuple: Number of points and regions, unchanged if the configuration is feasible or no feasible configuration is measured.
+        """
+        entry = self.lookup(mode, n_points, n_regions, min_bound, max_bound)
+        if entry is None or entry['acceptance_rate'] >= min_acceptance:
+            return n_points, n_regions
+        feasible = self.closest_feasible(mode, n_points, n_regions, min_bound, max_bound, min_acceptance)
+        if feasible is None:
+            return n_points, n_regions
+        return feasible['n_points'], feasible['n_regions']
+
+    def _candidates(self, mode, min_bound, max_bound):
+        return [entry for entry in self.entries
+                if entry['mode'] == mode.name and entry['min_bound'] == min_bound and entry['max_bound'] == max_bound]
+
+def _distance(entry, n_points, n_regions):
+    return abs(np.log(entry['n_points'] / n_points)) + abs(np.log(entry['n_regions'] / n_regions))
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the acceptance rate of a grid of track generation parameters.")
+    parser.add_argument('--seeds', type=int, default=20, help="Number of tracks per configuration.")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes.")
+    parser.add_argument('--output', default='feasibility.json', help="JSON file to write the lookup table to.")
+    args = parser.parse_args()
+
+    feasibility_map = sweep(n_seeds=args.seeds, workers=args.workers)
+    for entry in feasibility_map.entries:
+        print("{mode:<7} {n_points:>4} pts {n_regions:>4} regs: acceptance {acceptance_rate:.2f}, success {success_rate:.2f}".format(**entry))
+    feasibility_map.save(args.output)
+
+if __name__ == '__main__':
+    main()
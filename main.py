@@ -1,4 +1,6 @@
+import argparse, os
 from track_generator import TrackGenerator
+from writers import TrackWriter
 from utils import Mode, SimType
 
 # Input parameters
@@ -14,8 +16,37 @@ plot_track = False
 visualise_voronoi = False
 create_output_file = True
 output_location = '/'
+output_name = 'random_track_{seed}'
 
-# Generate track
-track_gen = TrackGenerator(n_points, n_regions, min_bound, max_bound, mode, plot_track, visualise_voronoi, create_output_file, output_location, lat_offset=51.197682, lon_offset=5.323411, sim_type=sim_type)
-track_gen.create_track()
-track_gen.export_plot()
+# Command line options
+parser = argparse.ArgumentParser(description="Generate random tracks.")
+parser.add_argument('--seed', type=int, default=None, help="Seed of the (first) track.")
+parser.add_argument('--batch', type=int, default=None, help="Generate a batch of this many tracks in parallel.")
+parser.add_argument('--workers', type=int, default=None, help="Number of worker processes for batch generation.")
+parser.add_argument('--batch-output', default=None, help="Directory or .zip archive to write the batch tracks to, one file per seed, or a .gpx or .geojson file to write all tracks to with the GPX or GeoJSON sim type.")
+args = parser.parse_args()
+
+if args.batch is None:
+    # Generate track
+    track_gen = TrackGenerator(n_points, n_regions, min_bound, max_bound, mode, plot_track, visualise_voronoi, create_output_file, output_location, lat_offset=51.197682, lon_offset=5.323411, sim_type=sim_type, output_name=output_name, seed=args.seed)
+    track_gen.create_track()
+    track_gen.export_plot()
+    print("Seed {}".format(track_gen.seed))
+else:
+    # Generate batch of tracks, seeds are consecutive if a seed is given
+    seeds = None if args.seed is None else range(args.seed, args.seed + args.batch)
+    params = dict(n_points=n_points, n_regions=n_regions, min_bound=min_bound, max_bound=max_bound, mode=mode,
+                  plot_track=False, visualise_voronoi=False, create_output_file=False, output_location=output_location,
+                  lat_offset=51.197682, lon_offset=5.323411, sim_type=sim_type)
+    batch_output = args.batch_output or os.path.realpath(os.path.dirname(__file__)) + output_location
+    n_failed = 0
+    with TrackWriter(sim_type, batch_output, name=output_name) as writer:
+        for result in TrackGenerator.generate_batch(args.batch, seeds=seeds, workers=args.workers, **params):
+            if result.error is None:
+                metadata = dict(seed=result.seed, mode=mode.name, n_points=n_points, n_regions=n_regions, z_offset=0, lat_offset=params['lat_offset'], lon_offset=params['lon_offset'], centreline=result.track.centreline)
+                if create_output_file: writer.write(result.track.cones_left, result.track.cones_right, metadata)
+                print("Seed {}: {} left cones, {} right cones".format(result.seed, len(result.track.cones_left), len(result.track.cones_right)))
+            else:
+                n_failed += 1
+                print("Seed {}: failed, {}".format(result.seed, result.error))
+    print("Generated {} of {} tracks".format(args.batch - n_failed, args.batch))
@@ -0,0 +1,125 @@
+import matplotlib as mpl
+import matplotlib.pyplot as plt
+
+def use_batch_mode():
+    """
+    Switches matplotlib to a non-interactive backend, for rendering in worker processes or without a display.
+    Figures are then only written to files.
+    """
+    mpl.use('Agg')
+
+def _finish(fig, path):
+    """
+    Saves the figure to the path and closes it, or shows it if no path is given.
+    """
+    if path is None:
+        plt.show()
+    else:
+        fig.savefig(path, dpi=300, bbox_inches='tight')
+        plt.close(fig)
+
+def visualise_voronoi(vor, sorted_vertices, random_point_indices, input_points, x, y, path=None):
+    """
+    Visualises the voronoi diagram and the resulting track.
+
+    Args:
+        vor (scipy.spatial.qhull.Voronoi): Voronoi diagram object.
+        sorted_vertices (numpy.ndarray): Selected vertices sorted clockwise.
+        random_point_indices (numpy.ndarray): Selected points.
+        input_points (numpy.ndarray): All Voronoi points.
+        x (numpy.ndarray): X-coordinates of the interpolated track.
+        y (numpy.ndarray): Y-coordinates of the interpolated track.
+        path (str): File to save the figure to. If None, the figure is shown.
+    """
+    # Plot initial points
+    fig = plt.figure()
+    plt.plot(vor.filtered_points[:, 0], vor.filtered_points[:, 1], 'b.')
+
+    # Plot vertices points
+    for region in vor.filtered_regions:
+        vertices = vor.vertices[region, :]
+        plt.plot(vertices[:, 0], vertices[:, 1], 'go')
+
+    # Plot edges
+    for region in vor.filtered_regions:
+        vertices = vor.vertices[region + [region[0]], :]
+        plt.plot(vertices[:, 0], vertices[:, 1], 'k-')
+
+    # Plot selected vertices
+    plt.scatter(sorted_vertices[:,0], sorted_vertices[:,1], color='y', s=200, label='Selected vertices')
+
+    # Plot selected points
+    plt.scatter(*input_points[random_point_indices].T, s=100, marker='x', color='b', label='Selected points')
+
+    # Plot track
+    plt.scatter(x, y)
+    plt.xlabel('x [m]')
+    plt.ylabel('y [m]')
+    plt.axis('equal')
+    plt.legend()
+    _finish(fig, path)
+
+def plot_track(cones_left, cones_right, path=None):
+    """
+    Plots the resulting track. The car will start at the origin.
+
+    Args:
+        cones_left (numpy.ndarray): Nx2 numpy array of left cone coordinates.
+        cones_right (numpy.ndarray): Nx2 numpy array of right cone coordinates.
+        path (str): File to save the figure to. If None, the figure is shown.
+    """
+    fig = plt.figure()
+    plt.scatter(*cones_left.T, color='b', s=1)
+    plt.scatter(*cones_right.T, color='y', s=1)
+
+    plt.xlabel('x [m]')
+    plt.ylabel('y [m]')
+    plt.axis('equal')
+    plt.grid()
+    _finish(fig, path)
+
+def plot_track_grid(tracks, path=None, titles=None, plots_per_row=4):
+    """
+    Plots several tracks in a grid, each track centered in its own square subplot.
+
+    Args:
+        tracks (list): Pairs of Nx2 numpy arrays of left and right cone coordinates.
+        path (str): File to save the figure to. If None, the figure is shown.
+        titles (list): Title of each subplot.
+        plots_per_row (int): Number of subplots per row.
+    """
+    num_plots = len(tracks)
+    plots_per_row = min(plots_per_row, num_plots)
+    num_rows = -(-num_plots // plots_per_row)  # Ceiling division
+
+    fig, axes = plt.subplots(num_rows, plots_per_row, figsize=(plots_per_row * 5, num_rows * 5), squeeze=False)
+    axes = axes.flatten()
+
+    for idx, (cones_left, cones_right) in enumerate(tracks):
+        ax = axes[idx]
+        ax.scatter(*cones_left.T, color='b', s=4)
+        ax.scatter(*cones_right.T, color='#f7b307', s=4)
+
+        # Find track bounds and center plot
+        x_min = min(cones_left[:, 0].min(), cones_right[:, 0].min())
+        x_max = max(cones_left[:, 0].max(), cones_right[:, 0].max())
+        y_min = min(cones_left[:, 1].min(), cones_right[:, 1].min())
+        y_max = max(cones_left[:, 1].max(), cones_right[:, 1].max())
+        x_center, y_center = (x_max + x_min) / 2, (y_max + y_min) / 2
+        plot_range = max(x_max - x_min, y_max - y_min) * 1.1
+
+        ax.set_xlim(x_center - plot_range/2, x_center + plot_range/2)
+        ax.set_ylim(y_center - plot_range/2, y_center + plot_range/2)
+
+        ax.set_xticks([])
+        ax.set_yticks([])
+        if titles is not None:
+            ax.set_title(titles[idx], fontsize=10)
+        ax.set_aspect('equal')
+
+    # Hide unused subplots
+    for ax in axes[num_plots:]:
+        ax.axis("off")
+
+    plt.tight_layout()
+    _finish(fig, path)
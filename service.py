@@ -0,0 +1,204 @@
+import asyncio, json, os
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+from track_generator import BatchResult, _generate_batch_item
+from utils import Mode, random_seed
+
+def _params_key(params):
+    """
+    Returns a hashable key of a parameter set.
+    """
+    return json.dumps({name: value.name if isinstance(value, Mode) else value for name, value in params.items()}, sort_keys=True, default=repr)
+
+class TrackService:
+    """
+    Asynchronous track generation service.
+    Requests are put in a bounded queue and handled by a limited number of concurrent jobs in a process pool.
+    Requests that take longer than the timeout fail, which protects against configurations that never converge.
+    For common parameter sets a small buffer of ready tracks is kept, so that unseeded requests are answered immediately.
+    """
+
+    def __init__(self, workers=None, concurrency=None, max_queue=64, timeout=30., prefetch_params=(), prefetch=2):
+        """
+        Args:
+            workers (int): Number of worker processes. If None, the number of CPUs is used.
+            concurrency (int): Maximum number of tracks generated at the same time. If None, the number of workers is used.
+            max_queue (int): Maximum number of waiting requests, further requests wait until there is room.
+            timeout (float): Default time limit of a request in seconds.
+            prefetch_params (list): Parameter sets (TrackGenerator keyword arguments) to keep ready tracks for.
+            prefetch (int): Number of ready tracks to keep per prefetched parameter set.
+        """
+        self._workers = workers
+        self._concurrency = concurrency
+        self._max_queue = max_queue
+        self._timeout = timeout
+        self._prefetch_params = list(prefetch_params)
+        self._prefetch = prefetch
+        self._executor = None
+        self._queue = None
+        self._buffers = {}
+        self._tasks = []
+
+    async def start(self):
+        """
+        Starts the process pool, the request handlers and the prefetching of tracks.
+        """
+        self._executor = futures.ProcessPoolExecutor(max_workers=self._workers)
+        self._queue = asyncio.Queue(maxsize=self._max_queue)
+        concurrency = self._concurrency or self._workers or os.cpu_count()
+        self._tasks = [asyncio.create_task(self._handle_requests()) for _ in range(concurrency)]
+
+        for params in self._prefetch_params:
+            buffer = asyncio.Queue(maxsize=self._prefetch)
+            self._buffers[_params_key(params)] = buffer
+            self._tasks.append(asyncio.create_task(self._fill_buffer(params, buffer)))
+
+    async def stop(self):
+        """
+        Stops handling requests and shuts down the process pool.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def request(self, params, seed=None, timeout=None):
+        """
+        Requests a track.
+
+        Args:
+            params (dict): Keyword arguments passed to the TrackGenerator constructor.
+            seed (int): Seed of the track. If None, a prefetched track is returned if available.
+            timeout (float): Time limit in seconds. If None, the default timeout of the service is used.
+
+        Returns:
+            BatchResult: Seed and track, or the error if the track could not be generated.
+        """
+        if seed is None:
+            buffer = self._buffers.get(_params_key(params))
+            if buffer is not None and not buffer.empty():
+                return buffer.get_nowait()
+            seed = random_seed()
+
+        result = asyncio.get_running_loop().create_future()
+        await self._queue.put((params, seed, timeout, result))
+        return await result
+
+    async def _handle_requests(self):
+        """
+        Handles queued requests one at a time.
+        """
+        while True:
+            params, seed, timeout, result = await self._queue.get()
+            try:
+                track = await self._generate(params, seed, timeout)
+                if not result.done():
+                    result.set_result(track)
+            except Exception as e:
+                # Answer the request instead of stopping the handler, e.g. when the process pool is broken
+                if not result.done():
+                    result.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    async def _fill_buffer(self, params, buffer):
+        """
+        Keeps a buffer of ready tracks for a parameter set, failed tracks are discarded.
+        """
+        while True:
+            try:
+                track = await self._generate(params, random_seed(), None)
+            except (BrokenProcessPool, RuntimeError):
+                # The process pool is broken or shut down, so no more tracks can be generated
+                return
+            except Exception:
+                # Back off, so that a failing parameter set does not keep the event loop busy
+                await asyncio.sleep(1.)
+                continue
+            if track.error is None:
+                await buffer.put(track)
+
+    async def _generate(self, params, seed, timeout):
+        """
+        Generates a track in the process pool.
+        The timeout is also passed to the generator, so that the worker process stops as well.
+        """
+        timeout = self._timeout if timeout is None else timeout
+        params = dict(params, timeout=params.get('timeout', timeout))
+        job = asyncio.get_running_loop().run_in_executor(self._executor, _generate_batch_item, params, seed)
+        try:
+            return await asyncio.wait_for(job, timeout)
+        except asyncio.TimeoutError:
+            return BatchResult(seed, None, "Timeout after {} s".format(timeout), None)
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        """
+        Serves tracks over a local socket. Each request is a line of JSON with the TrackGenerator keyword arguments
+        in 'params' (mode by name), and optionally 'seed' and 'timeout'. Each response is a line of JSON with the seed,
+        the cones and the error.
+
+        Args:
+            host (str): Host to listen on.
+            port (int): Port to listen on.
+        """
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def _handle_connection(self, reader, writer):
+        """
+        Answers the requests of a single connection.
+        """
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                message = json.loads(line)
+                params = dict(message['params'])
+                if 'mode' in params:
+                    params['mode'] = Mode[params['mode']]
+            except (ValueError, KeyError, TypeError) as e:
+                response = {'seed': None, 'error': "Invalid request: {!r}".format(e)}
+            else:
+                result = await self.request(params, message.get('seed'), message.get('timeout'))
+                response = {'seed': result.seed, 'error': result.error}
+                if result.error is None:
+                    response['cones_left'] = result.track.cones_left.tolist()
+                    response['cones_right'] = result.track.cones_right.tolist()
+            writer.write(json.dumps(response).encode() + b'\n')
+            await writer.drain()
+        writer.close()
+
+class LocalClient:
+    """
+    In-process client of a TrackService, stands in for a simulator instance.
+    """
+
+    def __init__(self, service, **params):
+        """
+        Args:
+            service (TrackService): Running service.
+            **params: Keyword arguments passed to the TrackGenerator constructor for every track.
+        """
+        self._service = service
+        self._params = params
+
+    async def get_track(self, seed=None, timeout=None):
+        """
+        Args:
+            seed (int): Seed of the track. If None, a random or prefetched track is returned.
+            timeout (float): Time limit in seconds.
+
+        Returns:
+            BatchResult: Seed and track, or the error if the track could not be generated.
+        """
+        return await self._service.request(self._params, seed, timeout)
@@ -0,0 +1,81 @@
+import time
+
+class GenerationStats:
+    """
+    Counters and per-stage wall times collected while generating a single track.
+
+    Attributes:
+        attempts (int): Number of region selections (outer loop iterations) needed to find a valid track.
+        diagrams (int): Number of Voronoi diagrams created.
+        spline_fits (int): Number of spline fits during curvature repair, over all attempts.
+        stage_times (dict): Accumulated wall time in seconds per stage.
+        rejections (dict): Number of rejected attempts per reason.
+    """
+
+    def __init__(self):
+        self.attempts = 0
+        self.diagrams = 0
+        self.spline_fits = 0
+        self.stage_times = {}
+        self.rejections = {}
+        self._lap_start = time.perf_counter()
+
+    def start(self):
+        """
+        Starts the clock for the first stage.
+        """
+        self._lap_start = time.perf_counter()
+
+    def lap(self, stage):
+        """
+        Adds the time since the previous lap (or start) to a stage.
+
+        Args:
+            stage (str): Name of the stage that just finished.
+        """
+        now = time.perf_counter()
+        self.stage_times[stage] = self.stage_times.get(stage, 0.) + now - self._lap_start
+        self._lap_start = now
+
+    def reject(self, reason):
+        """
+        Counts a rejected attempt.
+
+        Args:
+            reason (str): Reason why the attempt was rejected.
+        """
+        self.rejections[reason] = self.rejections.get(reason, 0) + 1
+
+    def as_dict(self):
+        """
+        Returns:
+            dict: Counters, stage times and rejections.
+        """
+        return {'attempts': self.attempts, 'diagrams': self.diagrams, 'spline_fits': self.spline_fits, 'stage_times': dict(self.stage_times), 'rejections': dict(self.rejections)}
+
+class NullStats:
+    """
+    Stand-in for GenerationStats when stats are not collected, all calls do nothing.
+    """
+    attempts = 0
+    diagrams = 0
+    spline_fits = 0
+    stage_times = {}
+    rejections = {}
+
+    def __setattr__(self, name, value):
+        pass
+
+    def start(self):
+        pass
+
+    def lap(self, stage):
+        pass
+
+    def reject(self, reason):
+        pass
+
+    def as_dict(self):
+        return None
+
+NULL_STATS = NullStats()
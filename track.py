@@ -0,0 +1,121 @@
+import numpy as np
+from collections import namedtuple
+
+# Quality metrics of a track, computed from the interpolated track during generation
+# The bounding box is measured in the frame of the Voronoi diagram
+TrackMetrics = namedtuple('TrackMetrics', ['length', 'straight_ratio', 'min_radius', 'n_corners', 'width', 'height'])
+
+def track_metrics(x, y, abs_curvature, distances, straight_threshold, corner_threshold):
+    """
+    Computes the quality metrics of an interpolated track.
+
+    Args:
+        x (numpy.ndarray): X-coordinates of the interpolated track, first and last point are the same.
+        y (numpy.ndarray): Y-coordinates of the interpolated track.
+        abs_curvature (numpy.ndarray): Absolute curvature at every point of the interpolated track.
+        distances (numpy.ndarray): Length of every segment of the interpolated track.
+        straight_threshold (float): Maximum curvature of straight segments in 1/meters.
+        corner_threshold (float): Minimum curvature of corners in 1/meters.
+
+    Returns:
+        TrackMetrics: Length in meters, fraction of the length on straights, minimum radius in meters,
+            number of corners and the width and height of the bounding box in meters.
+    """
+    length = distances.sum()
+    segment_curvature = abs_curvature[:-1]
+
+    # A corner starts where the curvature rises above the corner threshold, the track is closed so the comparison wraps around
+    in_corner = segment_curvature > corner_threshold
+    n_corners = np.count_nonzero(in_corner & ~np.roll(in_corner, 1))
+    if n_corners == 0 and in_corner.all():
+        n_corners = 1
+
+    return TrackMetrics(
+        length=float(length),
+        straight_ratio=float(distances[segment_curvature <= straight_threshold].sum() / length),
+        min_radius=float(1. / abs_curvature.max()),
+        n_corners=int(n_corners),
+        width=float(x.max() - x.min()),
+        height=float(y.max() - y.min()),
+    )
+
+def _frozen(array, dtype):
+    """
+    Returns a contiguous read-only copy of the array.
+    """
+    array = np.array(array, dtype=dtype, order='C')
+    array.flags.writeable = False
+    return array
+
+class Track:
+    """
+    Immutable result of a generated track.
+    All coordinates are float32 arrays in the frame of the start position: the car starts at the origin facing the x-axis.
+    Derived properties are computed on first access. Pickling only stores the arrays, so tracks are cheap to send between processes.
+    """
+
+    __slots__ = ('seed', 'cones_left', 'cones_right', 'centreline', 'curvature', 'start_pose', 'regions', 'input_points', 'metrics', 'stats', '_length', '_min_radius')
+
+    def __init__(self, seed, cones_left, cones_right, centreline, curvature, start_pose, regions, input_points, metrics=None, stats=None):
+        """
+        Args:
+            seed (int): Seed the track was generated with.
+            cones_left (numpy.ndarray): Nx2 numpy array of left cone coordinates.
+            cones_right (numpy.ndarray): Nx2 numpy array of right cone coordinates.
+            centreline (numpy.ndarray): Mx2 numpy array of the interpolated track, first and last point are the same.
+            curvature (numpy.ndarray): Absolute curvature at each point of the centreline in 1/meters.
+            start_pose (tuple): X, y and heading of the start position in the frame of the Voronoi diagram.
+            regions (numpy.ndarray): Indices of the input points of the selected Voronoi regions.
+            input_points (numpy.ndarray): Selected input points of the Voronoi diagram and their nearest neighbours,
+                kept in double precision to rebuild the selected regions for variants.
+            metrics (TrackMetrics): Quality metrics of the track, see track_metrics.
+            stats (dict): Generation statistics of the track, see GenerationStats.as_dict, None if they were not collected.
+        """
+        set_slot = object.__setattr__
+        set_slot(self, 'seed', seed)
+        set_slot(self, 'cones_left', _frozen(cones_left, np.float32))
+        set_slot(self, 'cones_right', _frozen(cones_right, np.float32))
+        set_slot(self, 'centreline', _frozen(centreline, np.float32))
+        set_slot(self, 'curvature', _frozen(curvature, np.float32))
+        set_slot(self, 'start_pose', tuple(float(value) for value in start_pose))
+        set_slot(self, 'regions', _frozen(regions, np.int32))
+        set_slot(self, 'input_points', _frozen(input_points, np.float64))
+        set_slot(self, 'metrics', metrics)
+        set_slot(self, 'stats', stats)
+        set_slot(self, '_length', None)
+        set_slot(self, '_min_radius', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Track is immutable.")
+
+    def __reduce__(self):
+        return Track, (self.seed, self.cones_left, self.cones_right, self.centreline, self.curvature, self.start_pose, self.regions, self.input_points, self.metrics, self.stats)
+
+    def __repr__(self):
+        return "Track(seed={}, cones={}+{}, length={:.1f} m)".format(self.seed, len(self.cones_left), len(self.cones_right), self.length)
+
+    @property
+    def length(self):
+        """
+        float: Length of the centreline in meters.
+        """
+        if self._length is None:
+            segments = np.diff(self.centreline.astype(np.float64), axis=0)
+            object.__setattr__(self, '_length', float(np.hypot(segments[:, 0], segments[:, 1]).sum()))
+        return self._length
+
+    @property
+    def min_radius(self):
+        """
+        float: Smallest radius of curvature of the centreline in meters.
+        """
+        if self._min_radius is None:
+            object.__setattr__(self, '_min_radius', float(1. / self.curvature.max()))
+        return self._min_radius
+
+    @property
+    def nbytes(self):
+        """
+        int: Size of the arrays of the track in bytes.
+        """
+        return self.cones_left.nbytes + self.cones_right.nbytes + self.centreline.nbytes + self.curvature.nbytes + self.regions.nbytes + self.input_points.nbytes
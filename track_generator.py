@@ -1,14 +1,31 @@
-import os, yaml
+import os, pickle, time, warnings
 import numpy as np
-import matplotlib as mpl
-mpl.use('pdf')
-import matplotlib.pyplot as plt
-from scipy import signal, spatial, interpolate
-from shapely.geometry.polygon import Point, LineString, Polygon
+from scipy import spatial, interpolate
+from shapely.geometry.polygon import Polygon
 from utils import *
-import math
-import gpxpy
-import gpxpy.gpx
+from voronoi import VoronoiIndex, LazyVoronoiIndex
+from stats import GenerationStats, NULL_STATS
+from writers import TrackWriter
+from track import Track, TrackMetrics, track_metrics
+from collections import namedtuple
+from concurrent import futures
+
+class TrackGenerationError(Exception):
+    """
+    Raised when a track could not be generated within the configured limits.
+
+    Attributes:
+        reason (str): Limit that was hit, 'max_attempts' or 'timeout'.
+        counts (dict): Counters collected until the limit was hit, see GenerationStats.as_dict.
+    """
+
+    def __init__(self, message, reason, counts):
+        super().__init__(message)
+        self.reason = reason
+        self.counts = counts
+
+# Result of a single track in a batch, error is None if the track was generated successfully
+BatchResult = namedtuple('BatchResult', ['seed', 'track', 'error', 'stats'])
 
 class TrackGenerator:
     """
@@ -29,7 +46,21 @@ class TrackGenerator:
                  z_offset: float = 0,
                  lat_offset: float = 0,
                  lon_offset: float = 0,
-                 sim_type: SimType = SimType.FSSIM):
+                 sim_type: SimType = SimType.FSSIM,
+                 output_name: str = 'random_track_{seed}',
+                 seed = None,
+                 collect_stats: bool = False,
+                 stats_hook = None,
+                 start_rule = None,
+                 max_attempts: int = None,
+                 max_repair_iterations: int = None,
+                 timeout: float = None,
+                 resample_after: int = None,
+                 feasibility_map = None,
+                 min_acceptance: float = 0.05,
+                 adjust_infeasible: bool = False,
+                 large_scale: bool = False,
+                 constraints: dict = None):
                  
         # Input parameters
         self._n_points = n_points                                               # [-]
@@ -40,22 +71,110 @@ class TrackGenerator:
         self._mode = mode
         self._sim_type = sim_type
 
+        # In large scale mode the diagram is triangulated with only the input points near the edges mirrored,
+        # and only the selected regions are computed, for large areas with many points
+        self._large_scale = large_scale
+        if large_scale and visualise_voronoi:
+            raise ValueError("Visualising the Voronoi diagram is not supported in large scale mode.")
+
+        # Random number generator used for every random draw
+        # Without a seed, a random seed is drawn so that the track can still be reproduced from its output file
+        if isinstance(seed, np.random.Generator):
+            self._seed = None
+            self._rng = seed
+        else:
+            self._seed = random_seed() if seed is None else int(seed)
+            self._rng = np.random.default_rng(self._seed)
+        self._seed_used = False
+
         # Track parameters
         self._track_width = 3.                                                  # [m]
         self._cone_spacing = 5.                                                 # [m]
         self._length_start_area = 6.                                            # [m]
         self._curvature_threshold = 1. / 3.75                                   # [m^-1]
         self._straight_threshold = 1. / 100.                                    # [m^-1]
+        self._corner_threshold = 1. / 25.                                       # [m^-1]
+
+        # Candidates whose metrics are outside these (min, max) ranges are rejected before placing cones, either bound may be None
+        self._constraints = constraints or {}
+        unknown = set(self._constraints) - set(TrackMetrics._fields)
+        if unknown:
+            raise ValueError("Unknown track metrics in constraints: {}. Available metrics are {}.".format(sorted(unknown), TrackMetrics._fields))
+
+        # Buffers of the spline evaluation, reused by every repair iteration
+        self._spline_buffers = {}
+
+        # Spline sampling parameters
+        self._sample_spacing = 1.                                               # [m]
+        self._coarse_sample_spacing = 2.                                        # [m]
+        self._refine_ratio = 0.5                                                # Coarse peaks above this fraction of the curvature threshold are refined
+
+        # Number of nearest neighbours of every selected input point kept with a track, to rebuild its regions for variants
+        self._n_neighbours = 20                                                 # [-]
+
+        # Scores candidate start lines, called with their indices on the interpolated track and the length of the straight before them
+        # The start line with the highest score is selected, if None the first candidate is selected
+        self._start_rule = start_rule
+
+        # Limits for configurations that do not converge, None means unlimited
+        # Reaching max_attempts or the timeout raises a TrackGenerationError, reaching max_repair_iterations only rejects the attempt
+        # After resample_after rejected attempts on the same Voronoi diagram, a new diagram is created from new input points
+        self._max_attempts = max_attempts                                       # [-]
+        self._max_repair_iterations = max_repair_iterations                     # [-]
+        self._timeout = timeout                                                 # [s]
+        self._resample_after = resample_after                                   # [-]
+
+        # Warn about, or adjust, configurations that rarely result in a track according to a measured feasibility map
+        if feasibility_map is not None:
+            self._check_feasibility(feasibility_map, min_acceptance, adjust_infeasible)
+
+        # Statistics of the last generated track, the hook is called with the statistics of every generated track
+        # Statistics are always collected when limits are set, to report them when a limit is hit
+        has_limits = any(limit is not None for limit in (max_attempts, max_repair_iterations, timeout))
+        self._collect_stats = collect_stats or stats_hook is not None or has_limits
+        self._stats_hook = stats_hook
+        self.stats = NULL_STATS
 
         # Output options
         self._plot_track = plot_track
         self._visualise_voronoi = visualise_voronoi
         self._create_output_file = create_output_file
         self._output_location = output_location
+        self._output_name = output_name
         self._z_offset = z_offset
         self._lat_offset = lat_offset
         self._lon_offset = lon_offset
 
+    def _check_feasibility(self, feasibility_map, min_acceptance, adjust):
+        """
+        Looks up the configuration in a feasibility map and warns if its acceptance rate is too low.
+        If adjust is set, the number of points and regions are changed to the closest feasible configuration instead.
+
+        Args:
+            feasibility_map (feasibility.FeasibilityMap): Measured acceptance rates of configurations.
+            min_acceptance (float): Minimum acceptance rate of attempts.
+            adjust (bool): Whether to adjust the configuration.
+        """
+        entry = feasibility_map.lookup(self._mode, self._n_points, self._n_regions, self._min_bound, self._max_bound)
+        if entry is None or entry['acceptance_rate'] >= min_acceptance:
+            return
+
+        message = "Configuration with {} points and {} regions has an acceptance rate of {:.3f} (measured at {} points and {} regions).".format(
+            self._n_points, self._n_regions, entry['acceptance_rate'], entry['n_points'], entry['n_regions'])
+        if adjust:
+            adjusted = feasibility_map.adjusted(self._mode, self._n_points, self._n_regions, self._min_bound, self._max_bound, min_acceptance)
+            if adjusted != (self._n_points, self._n_regions):
+                self._n_points, self._n_regions = adjusted
+                message += " Adjusted to {} points and {} regions.".format(self._n_points, self._n_regions)
+        warnings.warn(message)
+
+    @property
+    def seed(self):
+        """
+        int: Seed of the last track of create_track, None if a generator was passed instead of a seed.
+        """
+        return self._seed
+
     def bounded_voronoi(self, input_points, bounding_box):
         """
         Creates a Voronoi diagram bounded by the bounding box.
@@ -71,20 +190,9 @@ class TrackGenerator:
             scipy.spatial.qhull.Voronoi: Voronoi diagram object.
         """
         
-        def _mirror(boundary, axis):
-            mirrored = np.copy(points_center)
-            mirrored[:, axis] = 2 * boundary - mirrored[:, axis]
-            return mirrored
-        
-        x_min, x_max, y_min, y_max = bounding_box
-        
         # Mirror points around each boundary
         points_center = input_points
-        points_left = _mirror(x_min, axis=0) 
-        points_right = _mirror(x_max, axis=0) 
-        points_down = _mirror(y_min, axis=1)
-        points_up = _mirror(y_max, axis=1)
-        points = np.concatenate([points_center, points_left, points_right, points_down, points_up])
+        points = mirror_points(input_points, bounding_box)
         
         # Compute Voronoi
         vor = spatial.Voronoi(points)
@@ -102,269 +210,651 @@ class TrackGenerator:
         3.  Get the vertices belonging to the regions and sort them clockwise.
         4.  Interpolate between vertices.
         5.  Calculate curvature of track to check wether the curvature threshold is exceeded.
-        6.  If curvature threshold is exceeded, remove vertice where the curvature is the highest from its set.
+        6.  If curvature threshold is exceeded, remove the vertices where the curvature peaks above the threshold from its set.
             Repeat steps 4-6 until curvature is within limimts.
-        7.  Check if track does not cross itself. If so, go to step 2 and reiterate.
+        7.  Check if track does not cross itself, first on the interpolated line and then on the track boundaries. If so, go to step 2 and reiterate.
         8.  Find long enough straight section to place start line and start position.
         9.  Translate and rotate track to origin.
         10. Create track yaml file.
+
+        Returns:
+            Track: The generated track, also stored in the track attribute.
         """
+        self._start_track(self._next_seed())
+
         # Create bounded Voronoi diagram
-        input_points = np.random.uniform(self._min_bound, self._max_bound, (self._n_points, 2))
-        vor = self.bounded_voronoi(input_points, self._bounding_box)
+        index = self._create_diagram()
 
+        track, sorted_vertices, x, y, index = self._track_from_diagram(index, resample=True)
+
+        self.track = track
+        self.cones_left = track.cones_left
+        self.cones_right = track.cones_right
+
+        # Create track file
+        if self._visualise_voronoi: self.visualise_voronoi(index.vor, sorted_vertices, track.regions, track.input_points, x, y)
+        if self._plot_track: self.plot_track(track.cones_left, track.cones_right)
+        if self._create_output_file: self.output_yaml(track.cones_left, track.cones_right, track.centreline)
+        self.stats.lap('output')
+        if self._stats_hook is not None: self._stats_hook(self.stats)
+        return track
+
+    def generate_many_from_diagram(self, k):
+        """
+        Creates k tracks from a single bounded Voronoi diagram.
+        The diagram and its index are built once and every track only reruns steps 2-9 of create_track.
+        Output options are not applied to these tracks. The stats attribute holds the statistics of the last yielded track.
+        The tracks depend on the shared diagram, so they cannot be reproduced from a seed and their seed is None.
+
+        Args:
+            k (int): Number of tracks to create.
+
+        Yields:
+            Track: Each generated track.
+        """
+        self._start_track()
+        index = self._create_diagram()
+        for i in range(k):
+            if i > 0: self._start_track()
+            track, *_ = self._track_from_diagram(index)
+            if self._stats_hook is not None: self._stats_hook(self.stats)
+            yield track
+
+    def create_variant(self, track, jitter=2., n_added=0):
+        """
+        Creates a variant of an existing track, with the same general shape but perturbed corners.
+        The input points of the selected regions are jittered and new points can be added near the track,
+        then the diagram of the input points kept with the track, the selected points and their nearest neighbours,
+        is rebuilt and the same regions are repaired and validated again.
+        The rejection limits apply as in create_track.
+        Output options are not applied to variants. A variant cannot be reproduced from a seed, so its seed is None.
+
+        Args:
+            track (Track): Track to create a variant of, created with the same bounds.
+            jitter (float): Standard deviation of the displacement of the selected input points in meters.
+            n_added (int): Number of new input points added within the bounding box of the selected input points.
+
+        Returns:
+            Track: The variant, its input points include the added points.
+        """
+        self._start_track()
         while True:
-            
-            if self._mode.value == 1:
-                # Pick a random point and find its n closest neighbours
-                random_index = np.random.randint(0, self._n_points)
-                random_point_indices = [random_index]
-                random_point = input_points[random_index]
-                
-                for i in range(self._n_regions - 1):
-                    closest_point_index = closest_node(random_point, input_points, k=i+1)
-                    random_point_indices.append(closest_point_index)
-                    
-            elif self._mode.value == 2:
-                # Pick a random point, create a line extending from this point and find other points close to this line
-                random_index = np.random.randint(0, self._n_points)
-                random_heading = np.random.uniform(0, np.pi/2)
-                random_point = input_points[random_index]
-                
-                start = (random_point[0] - 1./2. * self._max_bound * np.cos(random_heading), random_point[1] - 1./2. * self._max_bound * np.sin(random_heading))
-                end = (random_point[0] + 1./2. * self._max_bound * np.cos(random_heading), random_point[1] + 1./2. * self._max_bound * np.sin(random_heading))
-                line = LineString([start, end])
-                distances = [Point(p).distance(line) for p in input_points]
-                random_point_indices = np.argpartition(distances, self._n_regions)[:self._n_regions]
+            self._check_limits()
+            self.stats.attempts += 1
+            input_points = self._perturb_points(track.input_points, track.regions, jitter, n_added)
+            candidate = self._candidate_from_vertices(self._variant_vertices(input_points, track.regions))
+            if candidate is not None:
+                break
+
+        variant, *_ = self._finish_track(input_points, track.regions, candidate)
+        if self._stats_hook is not None: self._stats_hook(self.stats)
+        return variant
+
+    def generate_variants(self, track, k, jitter=2., n_added=0):
+        """
+        Creates k variants of an existing track, see create_variant.
+        The stats attribute holds the statistics of the last yielded variant.
+
+        Args:
+            track (Track): Track to create variants of.
+            k (int): Number of variants to create.
+            jitter (float): Standard deviation of the displacement of the selected input points in meters.
+            n_added (int): Number of new input points added near the track.
+
+        Yields:
+            Track: Each variant.
+        """
+        for _ in range(k):
+            yield self.create_variant(track, jitter, n_added)
+
+    def _perturb_points(self, input_points, regions, jitter, n_added):
+        """
+        Returns a copy of the input points with the points of the selected regions jittered and new points appended,
+        so that the indices of the existing points stay the same. All points are kept inside the bounding box.
+        """
+        x_min, x_max, y_min, y_max = self._bounding_box
+        points = np.array(input_points, dtype=np.float64)
+        selected = np.unique(regions)
+        points[selected] += self._rng.normal(0, jitter, (len(selected), 2))
+        added = self._rng.uniform(points[selected].min(axis=0), points[selected].max(axis=0), (n_added, 2))
+        points = np.concatenate([points, added])
+        points[:, 0] = np.clip(points[:, 0], x_min, x_max)
+        points[:, 1] = np.clip(points[:, 1], y_min, y_max)
+        return points
+
+    def _variant_vertices(self, input_points, regions, k=20):
+        """
+        Returns the vertices of the selected regions, computed from a diagram of only the input points around them.
+        The local diagram contains the selected points and their k nearest neighbours. Its vertices are exact if no other
+        input point, or mirrored input point, is closer to them than their own points, otherwise, or if the local diagram
+        would not be much smaller, the full diagram is built.
+
+        Args:
+            input_points (numpy.ndarray): Coordinates of all input points.
+            regions (numpy.ndarray): Indices of the selected input points.
+            k (int): Number of nearest neighbours of every selected point in the local diagram.
+
+        Returns:
+            numpy.ndarray: Coordinates of the unique vertices of the selected regions.
+        """
+        regions = np.unique(regions)
+        _, neighbours = spatial.cKDTree(input_points).query(input_points[regions], k=min(k, len(input_points)))
+        subset = np.unique(neighbours)
+        # Only worth it if the local diagram is much smaller than the full one
+        if len(subset) < len(input_points) // 2:
+            index = VoronoiIndex(self.bounded_voronoi(input_points[subset], self._bounding_box))
+            vertex_indices = index.region_vertex_indices(np.searchsorted(subset, regions))
+            vertices = index.vertices[vertex_indices]
+
+            # Every vertex is equidistant to its closest points in the local diagram, check that no other point is closer
+            local_distance, _ = spatial.cKDTree(index.vor.points).query(vertices)
+            distance, _ = spatial.cKDTree(mirror_points(input_points, self._bounding_box)).query(vertices)
+            if np.all(distance >= local_distance - 1e-6):
+                self.stats.diagrams += 1
+                self.stats.lap('voronoi')
+                return vertices
+
+        return self._create_diagram(input_points).region_vertex_coordinates(regions)
+
+    def _create_diagram(self, input_points=None):
+        """
+        Creates an indexed bounded Voronoi diagram, step 1 of create_track.
+
+        Args:
+            input_points (numpy.ndarray): Coordinates of the input points. If None, new random input points are drawn.
+
+        Returns:
+            VoronoiIndex: Index of the bounded Voronoi diagram, or LazyVoronoiIndex in large scale mode.
+        """
+        if input_points is None:
+            input_points = self._rng.uniform(self._min_bound, self._max_bound, (self._n_points, 2))
+        if self._large_scale:
+            index = LazyVoronoiIndex(input_points, self._bounding_box)
+        else:
+            index = VoronoiIndex(self.bounded_voronoi(input_points, self._bounding_box))
+        self.stats.diagrams += 1
+        self.stats.lap('voronoi')
+        return index
+
+    def _track_from_diagram(self, index, resample=False):
+        """
+        Creates a track from an indexed bounded Voronoi diagram, steps 2-9 of create_track.
+
+        Args:
+            index (VoronoiIndex): Index of the bounded Voronoi diagram.
+            resample (bool): Whether a new diagram may be created after too many rejected attempts.
+
+        Returns:
+            tuple: The track, the selected vertices and the x and y coordinates of the interpolated track in the frame of the diagram,
+                and the index of the diagram the track was created from.
+        """
+        attempts_on_diagram = 0
+
+        while True:
+            self._check_limits()
+            if resample and self._resample_after is not None and attempts_on_diagram >= self._resample_after:
+                index = self._create_diagram()
+                attempts_on_diagram = 0
+            attempts_on_diagram += 1
+            self.stats.attempts += 1
+
+            random_point_indices = self._select_regions(index)
+            candidate = self._candidate_from_vertices(index.region_vertex_coordinates(random_point_indices))
+            if candidate is not None:
+                break
+
+        track, sorted_vertices, x, y = self._finish_track(index.points, random_point_indices, candidate, index.tree)
+        return track, sorted_vertices, x, y, index
+
+    def _select_regions(self, index):
+        """
+        Selects regions of the diagram based on the selection mode, step 2 of create_track.
+
+        Args:
+            index (VoronoiIndex): Index of the bounded Voronoi diagram.
+
+        Returns:
+            numpy.ndarray: Indices of the selected input points.
+        """
+        input_points = index.points
+        if self._mode.value == 1:
+            # Pick a random point and find its n closest neighbours, the closest one being the point itself
+            random_index = self._rng.integers(0, self._n_points)
+            random_point = input_points[random_index]
+            _, random_point_indices = index.tree.query(random_point, k=np.arange(1, self._n_regions + 1))
                 
-            elif self._mode.value == 3:
-                # Select regions randomly
-                random_point_indices = np.random.randint(0, self._n_points, self._n_regions)
+        elif self._mode.value == 2:
+            # Pick a random point, create a line extending from this point and find other points close to this line
+            random_index = self._rng.integers(0, self._n_points)
+            random_heading = self._rng.uniform(0, np.pi/2)
+            random_point = input_points[random_index]
             
-            # From the Voronoi regions, get the regions belonging to the randomly selected points
-            regions = np.array([np.array(region) for region in vor.regions], dtype=object)
-            random_region_indices = vor.point_region[random_point_indices]
-            random_regions = np.concatenate(regions[random_region_indices])
-            
-            # Get the vertices belonging to the random regions
-            random_vertices = np.unique(vor.vertices[random_regions], axis=0)
-            
-            # Sort vertices
-            sorted_vertices = clockwise_sort(random_vertices)
-            sorted_vertices = np.vstack([sorted_vertices, sorted_vertices[0]])
+            start = (random_point[0] - 1./2. * self._max_bound * np.cos(random_heading), random_point[1] - 1./2. * self._max_bound * np.sin(random_heading))
+            end = (random_point[0] + 1./2. * self._max_bound * np.cos(random_heading), random_point[1] + 1./2. * self._max_bound * np.sin(random_heading))
+            distances = point_segment_distance(input_points, start, end)
+            random_point_indices = np.argpartition(distances, self._n_regions)[:self._n_regions]
             
-            while True:
+        elif self._mode.value == 3:
+            # Select regions randomly
+            random_point_indices = self._rng.integers(0, self._n_points, self._n_regions)
+        return random_point_indices
+
+    def _candidate_from_vertices(self, random_vertices):
+        """
+        Creates and validates the interpolated track and its boundaries from the vertices of the selected regions, steps 3-7 of create_track.
+
+        Args:
+            random_vertices (numpy.ndarray): Coordinates of the unique vertices of the selected regions.
+
+        Returns:
+            tuple: Selected vertices, x and y coordinates, absolute curvature and segment lengths of the interpolated track, its metrics,
+                and the polygons of the track and its left and right boundaries. None if the candidate is rejected, the reason is recorded in the statistics.
+        """
+        # Sort vertices
+        sorted_vertices = clockwise_sort(random_vertices)
+        sorted_vertices = np.vstack([sorted_vertices, sorted_vertices[0]])
+        self.stats.lap('selection')
         
-                # Interpolate
-                tck, _ = interpolate.splprep([sorted_vertices[:,0], sorted_vertices[:,1]], s=0, per=True)
-                t = np.linspace(0, 1, 1000)
-                x, y = interpolate.splev(t, tck, der=0)
-                dx_dt, dy_dt = interpolate.splev(t, tck, der=1)
-                d2x_dt2, d2y_dt2 = interpolate.splev(t, tck, der=2)
-                
-                # Calculate curvature
-                k = curvature(dx_dt, d2x_dt2, dy_dt, d2y_dt2)
-                abs_curvature = np.abs(k)
-                
-                # Check if curvature exceeds threshold
-                peaks, _ = signal.find_peaks(abs_curvature)
-                exceeded_peaks = abs_curvature[peaks] > self._curvature_threshold
-                max_peak_index = abs_curvature[peaks].argmax()
-                is_curvature_exceeded = exceeded_peaks[max_peak_index]
-                
-                if is_curvature_exceeded:
-                    # Find vertice where curvature is exceeded and delete vertice from sorted vertices. Reiterate
-                    max_peak = peaks[max_peak_index]
-                    peak_coordinate = (x[max_peak], y[max_peak])
-                    vertice = closest_node(peak_coordinate, sorted_vertices, k=0)
-                    sorted_vertices = np.delete(sorted_vertices, vertice, axis=0)
-                    
-                    # Make sure that first and last coordinate are the same for periodic interpolation
-                    if not np.array_equal(sorted_vertices[0], sorted_vertices[-1]):
-                        sorted_vertices = np.vstack([sorted_vertices, sorted_vertices[0]])
-                else:
-                    break
-            
-            # Create track boundaries
-            track = Polygon(zip(x, y))
-            track_left = track.buffer(self._track_width / 2)
-            track_right = track.buffer(-self._track_width / 2)
-            
-            # Check if track does not cross itself
-            if track.is_valid and track_left.is_valid and track_right.is_valid:
-                if track.geom_type == track_left.geom_type == track_right.geom_type == 'Polygon':
-                    break
+        # Interpolate and remove vertices until the curvature is within limits
+        repaired = self.repair_curvature(sorted_vertices, self._max_repair_iterations)
+        self.stats.lap('repair')
+        if repaired is None:
+            self.stats.reject('repair_limit')
+            return None
+        x, y, abs_curvature, sorted_vertices = repaired
+        
+        # Reject tracks that cross themselves before creating the more expensive track boundaries
+        if self_intersects(x, y):
+            self.stats.lap('boundaries')
+            self.stats.reject('self_intersection')
+            return None
+        
+        # Create track boundaries
+        track = Polygon(zip(x, y))
+        track_left = track.buffer(self._track_width / 2)
+        track_right = track.buffer(-self._track_width / 2)
+        
+        # Check if track does not cross itself
+        if not track.is_valid:
+            rejection = 'invalid_track'
+        elif not (track_left.is_valid and track_right.is_valid):
+            rejection = 'invalid_boundary'
+        elif not track.geom_type == track_left.geom_type == track_right.geom_type == 'Polygon':
+            rejection = 'multipolygon_boundary'
+        else:
+            rejection = None
+        self.stats.lap('boundaries')
+        if rejection is not None:
+            self.stats.reject(rejection)
+            return None
 
-        # Calculate cone spacing        
-        cone_spacing_left = np.linspace(0, track_left.length, np.ceil(track_left.length / self._track_width).astype(int) + 1)[:-1]
-        cone_spacing_right= np.linspace(0, track_right.length, np.ceil(track_right.length / self._track_width).astype(int) + 1)[:-1]
-            
-        # Determine coordinates of cones
-        cones_left = np.asarray([np.asarray(track_left.exterior.interpolate(sp).xy).flatten() for sp in cone_spacing_left])
-        cones_right = np.asarray([np.asarray(track_right.exterior.interpolate(sp).xy).flatten() for sp in cone_spacing_right])
+        # Compute the metrics from the arc lengths, which are needed for the start pose as well, and check the constraints
+        with np.errstate(divide='ignore'):
+            distances = arc_length(x, y, 1 / abs_curvature)
+        metrics = track_metrics(x, y, abs_curvature, distances, self._straight_threshold, self._corner_threshold)
+        self.stats.lap('metrics')
+        if not self._satisfies_constraints(metrics):
+            self.stats.reject('constraints')
+            return None
+        return sorted_vertices, x, y, abs_curvature, distances, metrics, track, track_left, track_right
+
+    def _finish_track(self, input_points, random_point_indices, candidate, tree=None):
+        """
+        Places the cones, finds the start pose and moves the track to the origin, steps 8-9 of create_track.
+
+        Args:
+            input_points (numpy.ndarray): Input points of the Voronoi diagram.
+            random_point_indices (numpy.ndarray): Indices of the selected input points.
+            candidate (tuple): Validated candidate, see _candidate_from_vertices.
+            tree (scipy.spatial.cKDTree): KD-tree of the input points. If None, it is built when needed.
+
+        Returns:
+            tuple: The track, the selected vertices and the x and y coordinates of the interpolated track in the frame of the diagram.
+        """
+        sorted_vertices, x, y, abs_curvature, distances, metrics, track, track_left, track_right = candidate
+
+        # Determine coordinates of cones, evenly spaced along the track boundaries
+        cones_left = place_cones(np.asarray(track_left.exterior.coords), self._cone_spacing)
+        cones_right = place_cones(np.asarray(track_right.exterior.coords), self._cone_spacing)
+        self.stats.lap('cones')
 
         # Find straight section in track that is at least the length of the start area
         # If such a section cannot be found, adjust the straight_threshold and length_start_area variables
         # There is only a chance of this happening if n_regions == 1 
         straight_threshold = self._straight_threshold if abs_curvature.min() < self._straight_threshold else abs_curvature.min() + 0.1
         straight_sections = abs_curvature[:-1] <= straight_threshold
-        distances = arc_length(x, y, 1 / abs_curvature)
-        length_straights = distances * straight_sections
 
         # Find cumulative length of straight sections
-        for i in range(1, len(length_straights)):
-            if length_straights[i]:
-                length_straights[i] += length_straights[i-1]
+        length_straights = straight_run_lengths(distances, straight_sections)
                 
-        # Find start line and start pose
-        length_start_area = self._length_start_area if length_straights.max() > self._length_start_area else length_straights.max()
-        try:
-            start_line_index = np.where(length_straights > length_start_area)[0][0]
-        except IndexError:
+        # Find all candidate start lines, and select one by the start rule, or the first one
+        length_start_area = min(self._length_start_area, length_straights.max())
+        start_candidates = np.flatnonzero((length_straights >= length_start_area) & (length_straights > 0))
+        if len(start_candidates) == 0:
             raise Exception("Unable to find suitable starting position. Try to decrease the length of the starting area or different input parameters.")
+        if self._start_rule is None:
+            start_line_index = start_candidates[0]
+        else:
+            start_line_index = start_candidates[np.argmax(self._start_rule(start_candidates, length_straights[start_candidates]))]
         start_line = np.array([x[start_line_index], y[start_line_index]])
         start_position = np.asarray(track.exterior.interpolate(np.sum(distances[:start_line_index]) - length_start_area)).flatten()
         start_position = np.array([start_position[0].x, start_position[0].y]) 
         start_heading = float(np.arctan2(*(start_line - start_position)))
+        self.stats.lap('start_pose')
 
         # Translate and rotate track to origin
         M = transformation_matrix(-start_position, start_heading - np.pi/2)
         cones_left = M.dot(np.c_[cones_left, np.ones(len(cones_left))].T)[:-1].T
         cones_right = M.dot(np.c_[cones_right, np.ones(len(cones_right))].T)[:-1].T
+        centreline = M.dot(np.c_[x, y, np.ones(len(x))].T)[:-1].T
+        self.stats.lap('transform')
 
-        self.cones_left = cones_left
-        self.cones_right = cones_right
+        # Only keep the selected input points and their nearest neighbours with the track, the regions index into these points
+        if tree is None:
+            tree = spatial.cKDTree(input_points)
+        _, neighbours = tree.query(input_points[random_point_indices], k=min(self._n_neighbours, len(input_points)))
+        neighbourhood = np.unique(neighbours)
+        regions = np.searchsorted(neighbourhood, random_point_indices)
 
-        # Create track file
-        if self._visualise_voronoi: self.visualise_voronoi(vor, sorted_vertices, random_point_indices, input_points, x, y)
-        if self._plot_track: self.plot_track(cones_left, cones_right)
-        if self._create_output_file: self.output_yaml(cones_left.tolist(), cones_right.tolist())
+        # The statistics stored with the track cover its generation, writing output files is not included
+        start_pose = (start_position[0], start_position[1], np.pi/2 - start_heading)
+        return Track(self._track_seed, cones_left, cones_right, centreline, abs_curvature, start_pose, regions, input_points[neighbourhood], metrics, self.stats.as_dict()), sorted_vertices, x, y
 
-    def visualise_voronoi(self, vor, sorted_vertices, random_point_indices, input_points, x, y):
+    def repair_curvature(self, sorted_vertices, max_iterations=None):
         """
-        Visualises the voronoi diagram and the resulting track. 
-
+        Interpolates between the vertices and removes vertices until the curvature threshold is no longer exceeded.
+        The curvature is checked on coarse samples first, and only refined around coarse peaks that could exceed the threshold.
+        Every curvature peak above the threshold is mapped to the vertex with the closest spline parameter,
+        and all of these vertices are removed at once, so the spline is refitted once per pass instead of once per removed vertex.
+        The repaired track is sampled with a spacing of about _sample_spacing meters along its length.
+        
         Args:
-            vor (scipy.spatial.qhull.Voronoi): Voronoi diagram object.
-            sorted_vertices (numpy.ndarray): Selected vertices sorted clockwise.
-            random_point_indices (numpy.ndarray): Selected points.
-            input_points (numpy.ndarray): All Voronoi points.
-        """
-        # Plot initial points
-        plt.figure()
-        plt.plot(vor.filtered_points[:, 0], vor.filtered_points[:, 1], 'b.')
-
-        # Plot vertices points
-        for region in vor.filtered_regions:
-            vertices = vor.vertices[region, :]
-            plt.plot(vertices[:, 0], vertices[:, 1], 'go')
+            sorted_vertices (numpy.ndarray): Clockwise sorted vertices, first and last vertex are the same.
+            max_iterations (int): Maximum number of spline fits. If None, the number is not limited.
+        
+        Returns:
+            tuple: X-coordinates, y-coordinates and absolute curvature of the interpolated track, and the remaining vertices.
+                None if the curvature is still exceeded after the maximum number of spline fits, or with only three vertices left.
+        """
+        # Number of fine samples in between two coarse samples
+        n_refine = int(np.ceil(self._coarse_sample_spacing / self._sample_spacing))
+        iteration = 0
+        
+        while True:
+            if max_iterations is not None and iteration >= max_iterations:
+                return None
+            iteration += 1
+            
+            # Interpolate
+            tck, u = interpolate.splprep([sorted_vertices[:,0], sorted_vertices[:,1]], s=0, per=True)
+            polynomials = spline_polynomials(tck)
+            self.stats.spline_fits += 1
+            
+            # Sample coarsely, the length of the vertex polygon is an estimate of the track length
+            length = np.hypot(*np.diff(sorted_vertices, axis=0).T).sum()
+            t = np.linspace(0, 1, max(int(np.ceil(length / self._coarse_sample_spacing)), 64) + 1)
+            coarse = evaluate_spline(t, polynomials, self._spline_buffer('coarse', len(t)))
+            abs_curvature = np.abs(coarse[6], out=coarse[6])
+            
+            # Refine around coarse peaks that could exceed the threshold in between the samples
+            peak_t, peak_curvature = self._refined_peaks(t, abs_curvature, polynomials, n_refine)
             
-        # Plot edges
-        for region in vor.filtered_regions:
-            vertices = vor.vertices[region + [region[0]], :]
-            plt.plot(vertices[:, 0], vertices[:, 1], 'k-')
+            # Check if curvature exceeds threshold
+            exceeded = peak_curvature > self._curvature_threshold
+            if not exceeded.any():
+                # Sample the repaired track at the output resolution, the mean speed along the spline parameter is its length
+                # The track is sampled into new arrays, as the buffers are reused by the next repair
+                length = np.hypot(coarse[2], coarse[3]).mean()
+                t = np.linspace(0, 1, max(int(np.ceil(length / self._sample_spacing)), 64) + 1)
+                x, y, *_, k = evaluate_spline(t, polynomials)
+                abs_curvature = np.abs(k)
 
-        # Plot selected vertices
-        plt.scatter(sorted_vertices[:,0], sorted_vertices[:,1], color='y', s=200, label='Selected vertices')
+                # Narrow peaks can fall in between the coarse samples, check the output samples and refine around their peaks as well
+                peak_t, peak_curvature = self._refined_peaks(t, abs_curvature, polynomials, n_refine)
+                exceeded = peak_curvature > self._curvature_threshold
+                if not exceeded.any():
+                    return x, y, abs_curvature, sorted_vertices
+            
+            # Find vertices where curvature is exceeded, the last vertex is the same as the first one
+            n_vertices = len(sorted_vertices) - 1
+            vertices = np.abs(u[:, None] - peak_t[exceeded]).argmin(axis=0) % n_vertices
+            vertices = np.unique(vertices)
+            
+            # A periodic cubic spline needs at least three distinct vertices, in that case only remove the vertice with the highest peak
+            # With only three vertices left the curvature cannot be repaired
+            if n_vertices <= 3:
+                return None
+            if n_vertices - len(vertices) < 3:
+                max_peak = peak_t[peak_curvature.argmax()]
+                vertices = np.abs(u - max_peak).argmin() % n_vertices
+            
+            # Delete vertices from sorted vertices and make sure that first and last coordinate are the same for periodic interpolation
+            sorted_vertices = np.delete(sorted_vertices[:-1], vertices, axis=0)
+            sorted_vertices = np.vstack([sorted_vertices, sorted_vertices[0]])
 
-        # Plot selected points
-        plt.scatter(*input_points[random_point_indices].T, s=100, marker='x', color='b', label='Selected points')
+    def _refined_peaks(self, t, abs_curvature, polynomials, n_refine):
+        """
+        Finds the peaks of the sampled curvature that could exceed the threshold and evaluates the spline around them at a finer spacing.
 
-        # Plot track
-        plt.scatter(x, y)
-        plt.xlabel('x [m]')
-        plt.ylabel('y [m]')
-        plt.axis('equal')
-        plt.legend()
-        plt.show()
+        Args:
+            t (numpy.ndarray): Evenly spaced spline parameters from 0 to 1.
+            abs_curvature (numpy.ndarray): Absolute curvature at the spline parameters.
+            polynomials (tuple): Polynomials of the spline, see spline_polynomials.
+            n_refine (int): Number of fine samples in between two samples.
 
-    def plot_track(self, cones_left, cones_right):
+        Returns:
+            tuple: Spline parameters and absolute curvature of the refined peaks.
         """
-        Plots the resulting track. The car will start at the origin.
+        # The spline is periodic, so the first sample is compared with the last ones as well
+        closed = abs_curvature[:-1]
+        peaks = np.flatnonzero((closed > np.roll(closed, 1)) & (closed >= np.roll(closed, -1)) &
+                               (closed > self._refine_ratio * self._curvature_threshold))
+        if len(peaks) == 0:
+            return t[peaks], closed[peaks]
 
-        Args: 
-            cones_left (numpy.ndarray): Nx2 numpy array of left cone coordinates.
-            cones_right (numpy.ndarray): Nx2 numpy array of right cone coordinates.       
-        """
-        plt.figure()
-        plt.scatter(*cones_left.T, color='b', s=1)
-        plt.scatter(*cones_right.T, color='y', s=1)
-
-        plt.xlabel('x [m]')
-        plt.ylabel('y [m]')
-        plt.axis('equal')
-        plt.grid()
-        plt.show()
-
-    def export_plot(self):
-        plt.figure()
-        plt.scatter(*self.cones_left.T, color='b', s=1)
-        plt.scatter(*self.cones_right.T, color='y', s=1)
-
-        plt.xlabel('x [m]')
-        plt.ylabel('y [m]')
-        plt.axis('equal')
-        plt.grid()
-        plt.savefig("tmp.pdf")
+        t_fine = np.mod(t[peaks, None] + np.linspace(-t[1], t[1], 2 * n_refine + 1), 1)
+        fine = evaluate_spline(t_fine.ravel(), polynomials, self._spline_buffer('fine', t_fine.size))
+        fine_curvature = np.abs(fine[6]).reshape(t_fine.shape)
+        return t_fine[np.arange(len(peaks)), fine_curvature.argmax(axis=1)], fine_curvature.max(axis=1)
+
+    def _spline_buffer(self, name, n_samples):
+        """
+        Returns a reusable buffer for evaluate_spline with room for at least n_samples, grown when needed.
+        """
+        buffer = self._spline_buffers.get(name)
+        if buffer is None or buffer.shape[1] < n_samples:
+            buffer = np.empty((7, max(n_samples, 2 * (0 if buffer is None else buffer.shape[1]))))
+            self._spline_buffers[name] = buffer
+        return buffer
+
+    def _satisfies_constraints(self, metrics):
+        """
+        Returns whether all metrics are within the (min, max) ranges of the constraints.
+        """
+        for name, (minimum, maximum) in self._constraints.items():
+            value = getattr(metrics, name)
+            if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+                return False
+        return True
+
+    def _next_seed(self):
+        """
+        Returns the seed of the next track of create_track. The first track uses the seed of the generator, every further track
+        is generated with a new seed drawn from the random generator, so that every track can be reproduced from its own seed.
+        None if a generator was passed instead of a seed.
+        """
+        if self._seed is None:
+            return None
+        if self._seed_used:
+            self._seed = int(self._rng.integers(0, 2**63 - 1))
+            self._rng = np.random.default_rng(self._seed)
+        return self._seed
+
+    def _start_track(self, seed=None):
+        """
+        Starts collecting statistics for a new track, if enabled, and starts the clock for the timeout.
+
+        Args:
+            seed (int): Seed recorded with the track, None if the track cannot be reproduced from a seed.
+        """
+        self._track_seed = seed
+        self._seed_used = True
+        self.stats = GenerationStats() if self._collect_stats else NULL_STATS
+        self.stats.start()
+        self._start_time = time.perf_counter()
+
+    def _check_limits(self):
+        """
+        Raises a TrackGenerationError if the maximum number of attempts or the timeout is reached.
+        """
+        if self._max_attempts is not None and self.stats.attempts >= self._max_attempts:
+            reason, message = 'max_attempts', "No valid track found in {} attempts.".format(self.stats.attempts)
+        elif self._timeout is not None and time.perf_counter() - self._start_time > self._timeout:
+            reason, message = 'timeout', "No valid track found within {} s.".format(self._timeout)
+        else:
+            return
+        raise TrackGenerationError(message + " Try different input parameters.", reason, self.stats.as_dict())
+
+    @classmethod
+    def generate_batch(cls, n, seeds=None, workers=None, **params):
+        """
+        Generates a batch of tracks in parallel using a process pool.
+        Every track gets its own random generator seeded with its seed, so each track can be reproduced individually.
+        Tracks are yielded as soon as they are finished, which means they are not necessarily in the order of the seeds.
+        A failed track is reported in its result and does not stop the batch, this includes a worker process that dies.
+
+        Args:
+            n (int): Number of tracks to generate.
+            seeds (list): Seed for each track. If None, n random seeds are drawn.
+            workers (int): Number of worker processes. If None, the number of CPUs is used. If 1, tracks are generated in this process.
+            **params: Keyword arguments passed to the TrackGenerator constructor.
+
+        Yields:
+            BatchResult: Seed and track, or the error if the track could not be generated,
+                and the generation statistics as a dictionary if collect_stats is set.
+
+        Raises:
+            ValueError: If the parameters cannot be pickled to send them to the worker processes, e.g. a stats_hook lambda.
+        """
+        if seeds is None:
+            seeds = [random_seed() for _ in range(n)]
+        seeds = [int(seed) for seed in seeds]
+        if len(seeds) != n:
+            raise ValueError("Number of seeds ({}) does not match number of tracks ({}).".format(len(seeds), n))
+
+        if workers == 1:
+            for seed in seeds:
+                yield _generate_batch_item(params, seed)
+            return
+
+        try:
+            pickle.dumps(params)
+        except Exception as e:
+            raise ValueError("Parameters cannot be sent to the worker processes: {!r}".format(e))
+
+        workers = workers or os.cpu_count()
+        pending_seeds = iter(seeds)
+        with futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            # Keep a limited amount of tracks in flight, so that large batches do not queue up all at once
+            running = {}
+            for seed in pending_seeds:
+                running[executor.submit(_generate_batch_item, params, seed)] = seed
+                if len(running) >= 2 * workers:
+                    break
+
+            while running:
+                done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    seed = running.pop(future)
+                    # Errors of the pool itself, such as a worker process that died, are reported for the tracks it was generating
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = BatchResult(seed, None, repr(e), None)
+                    yield result
+
+                    # Submit the next seed, seeds that cannot be submitted to a broken pool are reported as failed
+                    for seed in pending_seeds:
+                        try:
+                            running[executor.submit(_generate_batch_item, params, seed)] = seed
+                            break
+                        except Exception as e:
+                            yield BatchResult(seed, None, repr(e), None)
+
+    def visualise_voronoi(self, vor, sorted_vertices, random_point_indices, input_points, x, y, path=None):
+        """
+        Visualises the voronoi diagram and the resulting track, see rendering.visualise_voronoi.
+        """
+        import rendering
+        rendering.visualise_voronoi(vor, sorted_vertices, random_point_indices, input_points, x, y, path)
+
+    def plot_track(self, cones_left, cones_right, path=None):
+        """
+        Plots the resulting track, see rendering.plot_track.
+        """
+        import rendering
+        rendering.plot_track(cones_left, cones_right, path)
+
+    def export_plot(self, path='tmp.pdf'):
+        """
+        Saves a plot of the last generated track.
+
+        Args:
+            path (str): File to save the plot to.
+        """
+        import rendering
+        rendering.plot_track(self.cones_left, self.cones_right, path)
         
-    def output_yaml(self, cones_left, cones_right):
+    def output_yaml(self, cones_left, cones_right, centreline=None):
         """
-        Writes the track data to a yaml file.
+        Writes the track data to a file in the output format of the sim type.
+        The file name is created from the output name template, formatted with the track metadata.
 
         Args:
-            cones_left (list): Nx2 list of left cone coordinates.
-            cones_right (list): Nx2 list of right cone coordinates.
+            cones_left (numpy.ndarray): Nx2 numpy array of left cone coordinates.
+            cones_right (numpy.ndarray): Nx2 numpy array of right cone coordinates.
+            centreline (numpy.ndarray): Nx2 numpy array of the interpolated track, written by the GPX and GeoJSON formats.
         """
         abs_path_dir = os.path.realpath(os.path.dirname(__file__))
         track_file_dir = abs_path_dir + self._output_location
-        
-        if(self._sim_type == SimType.FSSIM):
-            track_file_name = track_file_dir + 'random_track.yaml'
-
-            with open(track_file_name, 'w') as outfile:
-                data = dict()
-                data['cones_left'] = cones_left
-                data['cones_right'] = cones_right
-                data['cones_orange'] = []
-                data['cones_orange_big'] = [[4.7, 2.5], [4.7, -2.5], [7.3, 2.5], [7.3, -2.5]]
-                data['starting_pose_cg'] = [0., 0., 0.]
-                data['tk_device'] = [[6., 3.], [6., -3.]]
-                yaml.dump(data, outfile)
-            
-        elif(self._sim_type == SimType.FSDS):
-            track_file_name = track_file_dir + 'random_track.csv'
-            
-            print("Saving " + track_file_name)
-            
-            with open(track_file_name, 'w') as outfile:
-                for cone in cones_left:
-                    outfile.write("blue," + str(cone[0]) + ',' + str(cone[1]) + ',0,0.01,0.01,0\n')
-                    
-                for cone in cones_right:
-                    outfile.write("yellow," + str(cone[0]) + ',' + str(cone[1]) + ',0,0.01,0.01,0\n')
-                    
-                outfile.write("big_orange,4.7,2.2,0,0.01,0.01,0\n")
-                outfile.write("big_orange,4.7,-2.2,0,0.01,0.01,0\n")
-                outfile.write("big_orange,7.3,2.2,0,0.01,0.01,0\n")
-                outfile.write("big_orange,7.3,-2.2,0,0.01,0.01,0\n")
-        elif(self._sim_type == SimType.GPX):
-            track_file_name = track_file_dir + 'random_track.gpx'
-            gpx = gpxpy.gpx.GPX()
-
-            # Create first track in our GPX:
-            gpx_track = gpxpy.gpx.GPXTrack()
-            gpx.tracks.append(gpx_track)
-            
-            # Create points:
-            for cone in cones_left:
-                lat  = self._lat_offset  + (cone[1] / 6378100) * (180 / math.pi)
-                lon = self._lon_offset + (cone[0] / 6378100) * (180 / math.pi) / math.cos(self._lat_offset * math.pi/180)
-                gpx.waypoints.append(gpxpy.gpx.GPXWaypoint(latitude=lat, longitude=lon, elevation=0 + self._z_offset))
-                
-            for cone in cones_right:
-                lat  = self._lat_offset  + (cone[1] / 6378100) * (180 / math.pi)
-                lon = self._lon_offset + (cone[0] / 6378100) * (180 / math.pi) / math.cos(self._lat_offset * math.pi/180)
-                gpx.waypoints.append(gpxpy.gpx.GPXWaypoint(latitude=lat, longitude=lon, elevation=0 + self._z_offset))
-            
-            with open(track_file_name, 'w') as outfile:
-                outfile.writelines(gpx.to_xml())
\ No newline at end of file
+
+        with TrackWriter(self._sim_type, track_file_dir, self._output_name) as writer:
+            track_file_name = writer.write(cones_left, cones_right, dict(self.metadata(), centreline=centreline))
+        print("Saving " + track_file_name)
+
+    def metadata(self):
+        """
+        Returns:
+            dict: Metadata of the generated track, passed to the output writers.
+        """
+        return {
+            'seed': self._seed,
+            'mode': self._mode.name,
+            'n_points': self._n_points,
+            'n_regions': self._n_regions,
+            'z_offset': self._z_offset,
+            'lat_offset': self._lat_offset,
+            'lon_offset': self._lon_offset,
+        }
+
+def _generate_batch_item(params, seed):
+    """
+    Generates a single track of a batch. Runs in a worker process.
+
+    Args:
+        params (dict): Keyword arguments passed to the TrackGenerator constructor.
+        seed (int): Seed of the track.
+
+    Returns:
+        BatchResult: Seed and track, or the error if the track could not be generated, and the generation statistics.
+    """
+    # Invalid parameters are reported in the result as well, without statistics
+    track_gen = None
+    try:
+        track_gen = TrackGenerator(**params, seed=seed)
+        track = track_gen.create_track()
+    except TrackGenerationError as e:
+        return BatchResult(seed, None, repr(e), e.counts)
+    except Exception as e:
+        return BatchResult(seed, None, repr(e), None if track_gen is None else track_gen.stats.as_dict())
+    return BatchResult(seed, track, None, track_gen.stats.as_dict())
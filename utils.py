@@ -1,3 +1,4 @@
+import functools, math
 import numpy as np
 from enum import Enum
 
@@ -28,10 +29,29 @@ class SimType(Enum):
         Output FSSIM compatible .yaml file.
     2. FSDS:
         Output FSDS compatible .csv file 
+    3. GPX:
+        Output cones as .gpx waypoints and the centreline as .gpx track
+    4. DATASET:
+        Append track to a binary dataset (tracks.cones and tracks.index), see dataset.py
+    5. GEOJSON:
+        Output cones as MultiPoints and the centreline as LineString in a .geojson FeatureCollection
+    
+    More output formats can be added with writers.register_writer.
     """
     FSSIM = 1
     FSDS = 2
     GPX = 3 
+    DATASET = 4
+    GEOJSON = 5
+
+def random_seed():
+    """
+    Draws a random seed from the operating system's entropy source.
+    
+    Returns:
+        int: Non-negative seed that fits in a signed 64-bit integer.
+    """
+    return int(np.random.SeedSequence().generate_state(1, np.uint64)[0] >> 1)
 
 def closest_node(node, nodes, k):
     """
@@ -49,6 +69,29 @@ def closest_node(node, nodes, k):
     distance = np.einsum('ij,ij->i', deltas, deltas)
     return np.argpartition(distance, k)[k]
 
+def point_segment_distance(points, start, end):
+    """
+    Calculates the distance of each point to a line segment.
+    
+    Args:
+        points (numpy.ndarray): Nx2 coordinates of points.
+        start (tuple): Start coordinate of the line segment.
+        end (tuple): End coordinate of the line segment.
+    
+    Returns:
+        numpy.ndarray: Distance of each point to the line segment.
+    """
+    start, end = np.asarray(start, dtype=float), np.asarray(end, dtype=float)
+    segment = end - start
+    segment_length_squared = segment.dot(segment)
+    deltas = points - start
+    
+    # Project points onto the segment and clamp the projection to the segment ends
+    if segment_length_squared > 0:
+        projection = np.clip(deltas.dot(segment) / segment_length_squared, 0., 1.)
+        deltas = deltas - projection[:, None] * segment
+    return np.sqrt(np.einsum('ij,ij->i', deltas, deltas))
+
 def clockwise_sort(p):
     """
     Sorts nodes in clockwise order.
@@ -63,6 +106,25 @@ def clockwise_sort(p):
     s = np.arctan2(d[:,0], d[:,1])
     return p[np.argsort(s),:]
 
+def mirror_points(points, bounding_box):
+    """
+    Mirrors points at each edge of the bounding box.
+    
+    Args:
+        points (numpy.ndarray): Nx2 coordinates of the points.
+        bounding_box (numpy.ndarray): Boundaries, [x_min, x_max, y_min, y_max].
+    
+    Returns:
+        numpy.ndarray: 5Nx2 coordinates, the points followed by their mirror images at the left, right, lower and upper edge.
+    """
+    def _mirror(boundary, axis):
+        mirrored = np.copy(points)
+        mirrored[:, axis] = 2 * boundary - mirrored[:, axis]
+        return mirrored
+    
+    x_min, x_max, y_min, y_max = bounding_box
+    return np.concatenate([points, _mirror(x_min, axis=0), _mirror(x_max, axis=0), _mirror(y_min, axis=1), _mirror(y_max, axis=1)])
+
 def curvature(dx_dt, d2x_dt2, dy_dt, d2y_dt2):
     """
     Calculates the curvature along a line.
@@ -76,11 +138,86 @@ def curvature(dx_dt, d2x_dt2, dy_dt, d2y_dt2):
     Returns:
         np.ndarray: Curvature along line.
     """
-    return (dx_dt**2 + dy_dt**2)**-1.5 * (dx_dt * d2y_dt2 - dy_dt * d2x_dt2)
+    speed_squared = dx_dt**2 + dy_dt**2
+    return (dx_dt * d2y_dt2 - dy_dt * d2x_dt2) / (speed_squared * np.sqrt(speed_squared))
+
+@functools.lru_cache()
+def _polynomial_matrices(p):
+    """
+    Returns the sample offsets, the inverse Vandermonde matrix that maps samples at these offsets to the coefficients
+    of a polynomial of degree p, and the matrices that map these coefficients to those of the first and second derivative.
+    """
+    s = np.linspace(0, 1, p + 1)
+    inverse_vandermonde = np.linalg.inv(np.vander(s, increasing=True))
+    
+    # Coefficient m of derivative d is coefficient m + d times (m + d)! / m!
+    derivatives = np.zeros((3, p + 1, p + 1))
+    for derivative in range(3):
+        for m in range(p + 1 - derivative):
+            derivatives[derivative, m, m + derivative] = math.factorial(m + derivative) // math.factorial(m)
+    return s, inverse_vandermonde, derivatives
+
+def spline_polynomials(tck):
+    """
+    Converts a parametric B-spline, as returned by scipy.interpolate.splprep, to polynomials per knot span.
+    Every span is evaluated at p + 1 equidistant points in a single call of scipy.interpolate.splev, which determines
+    its polynomial of degree p. The polynomials of the first and second derivative follow from it, so that the spline
+    can be evaluated many times with evaluate_spline.
+    
+    Args:
+        tck (tuple): Knots, coefficients of x and y, and degree of the spline.
+    
+    Returns:
+        tuple: Start of every knot span (plus the end of the last span), and a 3x(p+1)x2xS array of polynomial coefficients
+            in increasing order of power, for the position and both derivatives of x and y in every span.
+    """
+    # scipy is imported on use, so that the enums can be imported without it, e.g. for cache hits
+    from scipy import interpolate
+    knots, _, p = tck
+    s, inverse_vandermonde, derivatives = _polynomial_matrices(p)
+    breaks = knots[p:len(knots) - p]
+    widths = breaks[1:] - breaks[:-1]
+    
+    # Sample every span, then interpolate its polynomial in the normalised offset s = dt / width
+    samples = np.asarray(interpolate.splev((breaks[:-1, None] + widths[:, None] * s).ravel(), tck)).reshape(2, -1, p + 1)
+    powers = np.einsum('jk,csk->jcs', inverse_vandermonde, samples) / widths ** np.arange(p + 1)[:, None, None]
+    return breaks, np.einsum('dmj,jcs->dmcs', derivatives, powers)
+
+def evaluate_spline(t, polynomials, out=None):
+    """
+    Evaluates the position, the first and second derivatives and the curvature of a parametric spline in one pass.
+    Equivalent to three calls of scipy.interpolate.splev and curvature, using the polynomials from spline_polynomials.
+    
+    Args:
+        t (numpy.ndarray): Parameters to evaluate the spline at, within the knot range.
+        polynomials (tuple): Knot spans and polynomial coefficients, see spline_polynomials.
+        out (numpy.ndarray): Buffer of shape 7xM with M >= len(t) to write the result to, so that it can be reused. If None, a new array is created.
+    
+    Returns:
+        numpy.ndarray: 7xN array with rows x, y, dx_dt, dy_dt, d2x_dt2, d2y_dt2 and curvature, a view of the buffer if given.
+    """
+    breaks, coefficients = polynomials
+    t = np.asarray(t, dtype=np.float64)
+    result = np.empty((7, len(t))) if out is None else out[:, :len(t)]
+    
+    # Knot span of every parameter and the offset from its start
+    span = np.clip(np.searchsorted(breaks, t, side='right') - 1, 0, len(breaks) - 2)
+    dt = t - breaks[span]
+    
+    # Horner's scheme for the position and both derivatives of x and y at once, in place in the result
+    span_coefficients = np.take(coefficients, span, axis=-1)
+    values = result[:6].reshape(3, 2, len(t))
+    values[...] = span_coefficients[:, -1]
+    for m in range(coefficients.shape[1] - 2, -1, -1):
+        values *= dt
+        values += span_coefficients[:, m]
+    result[6] = curvature(result[2], result[4], result[3], result[5])
+    return result
 
 def arc_length(x, y, R):
     """
     Calculates the arc length between to points based on the radius of curvature of the path segment.
+    Straight segments (infinite radius) have the length of the chord.
     
     Args:
         x (numpy.ndarray): X-coordinates.
@@ -94,10 +231,116 @@ def arc_length(x, y, R):
     R = R[:-1]
     
     distance = np.sqrt((x1 - x0)**2 + (y1 - y0)**2)
-    theta = 2 * np.arcsin(0.5 * distance / R)
-    arc_length = R * theta
+    
+    # Arc length is the chord times arcsin(r)/r, with r = distance / (2 R), which tends to 1 for straight segments
+    r = np.clip(0.5 * distance / R, 0., 1.)
+    ratio = np.ones_like(r)
+    curved = r > 0
+    ratio[curved] = np.arcsin(r[curved]) / r[curved]
+    arc_length = distance * ratio
     return arc_length
 
+def straight_run_lengths(distances, straight_sections):
+    """
+    Calculates for each segment of a closed line the length of the straight section up to and including that segment.
+    Straight sections that continue across the end of the line into its start are taken into account.
+    
+    Args:
+        distances (numpy.ndarray): Length of each segment.
+        straight_sections (numpy.ndarray): Whether each segment is straight.
+    
+    Returns:
+        numpy.ndarray: Cumulative length of the straight section ending at each segment, 0 for curved segments.
+    """
+    if straight_sections.all():
+        return np.cumsum(distances)
+    
+    # Rotate such that the line starts with a curved segment, then no straight section crosses the seam
+    shift = np.argmin(straight_sections)
+    distances = np.roll(distances, -shift)
+    straight_sections = np.roll(straight_sections, -shift)
+    
+    # Cumulative length, minus the cumulative length before the start of each straight section
+    straight_distances = distances * straight_sections
+    cumulative = np.cumsum(straight_distances)
+    section_starts = straight_sections & ~np.roll(straight_sections, 1)
+    base = np.maximum.accumulate(np.where(section_starts, cumulative - straight_distances, 0.))
+    run_lengths = (cumulative - base) * straight_sections
+    return np.roll(run_lengths, shift)
+
+def self_intersects(x, y):
+    """
+    Checks whether a closed line crosses itself.
+    Only segments whose bounding circles overlap are tested, these are found with a KD-tree on the segment midpoints.
+    
+    Args:
+        x (numpy.ndarray): X-coordinates of the closed line, first and last coordinate are the same.
+        y (numpy.ndarray): Y-coordinates of the closed line, first and last coordinate are the same.
+    
+    Returns:
+        bool: True if two non-adjacent segments intersect.
+    """
+    from scipy import spatial
+    points = np.column_stack([x, y])
+    starts, ends = points[:-1], points[1:]
+    n_segments = len(starts)
+    midpoints = (starts + ends) / 2
+    max_half_length = np.sqrt(np.max(np.sum((ends - starts)**2, axis=1))) / 2
+    
+    # Candidate pairs of segments that are close enough to intersect, adjacent segments always touch
+    pairs = spatial.cKDTree(midpoints).query_pairs(2 * max_half_length, output_type='ndarray')
+    offsets = np.abs(pairs[:, 0] - pairs[:, 1])
+    pairs = pairs[(offsets != 1) & (offsets != n_segments - 1)]
+    if len(pairs) == 0:
+        return False
+    
+    # Two segments intersect if the end points of each segment lie on opposite sides of the other segment
+    a, b = starts[pairs[:, 0]], ends[pairs[:, 0]]
+    c, d = starts[pairs[:, 1]], ends[pairs[:, 1]]
+    def _cross(o, p, q):
+        return (p[:, 0] - o[:, 0]) * (q[:, 1] - o[:, 1]) - (p[:, 1] - o[:, 1]) * (q[:, 0] - o[:, 0])
+    crosses = (_cross(a, b, c) * _cross(a, b, d) < 0) & (_cross(c, d, a) * _cross(c, d, b) < 0)
+    return bool(crosses.any())
+
+def place_cones(ring, spacing):
+    """
+    Places cones evenly along a closed ring, starting at its first coordinate.
+    The spacing is adjusted slightly such that the ring length is a multiple of the spacing.
+    
+    Args:
+        ring (numpy.ndarray): Nx2 coordinates of the ring, first and last coordinate are the same.
+        spacing (float): Maximum distance between two cones in meters.
+    
+    Returns:
+        numpy.ndarray: Mx2 coordinates of the cones.
+    """
+    # Cumulative arc length along the ring
+    segment_lengths = np.sqrt(np.sum(np.diff(ring, axis=0)**2, axis=1))
+    s = np.concatenate([[0.], np.cumsum(segment_lengths)])
+    
+    # Interpolate all cone positions at once
+    n_cones = int(np.ceil(s[-1] / spacing))
+    s_cones = np.linspace(0, s[-1], n_cones + 1)[:-1]
+    return np.column_stack([np.interp(s_cones, s, ring[:, 0]), np.interp(s_cones, s, ring[:, 1])])
+
+def local_to_geodetic(points, lat_offset, lon_offset):
+    """
+    Converts local coordinates to latitude and longitude, using a spherical earth around the origin.
+    
+    Args:
+        points (numpy.ndarray): Nx2 local x and y coordinates in meters.
+        lat_offset (float): Latitude of the origin in degrees.
+        lon_offset (float): Longitude of the origin in degrees.
+    
+    Returns:
+        tuple: Latitudes and longitudes in degrees.
+    """
+    # Tracks store float32 coordinates, which are too coarse once the offset in degrees is added
+    points = np.asarray(points, dtype=np.float64)
+    lat = lat_offset + np.degrees(points[:, 1] / 6378100)
+    lon = lon_offset + np.degrees(points[:, 0] / 6378100) / np.cos(np.radians(lat_offset))
+    return lat, lon
+
 def transformation_matrix(displacement, angle):
     """
     Translate, then rotate around origin.
@@ -0,0 +1,215 @@
+import numpy as np
+from scipy import spatial
+
+class VoronoiIndex:
+    """
+    Array-backed index of the regions of a bounded Voronoi diagram.
+    Built once per diagram, so that every region selection on the same diagram only needs cheap array lookups.
+
+    Attributes:
+        vor (scipy.spatial.qhull.Voronoi): The bounded Voronoi diagram.
+        points (numpy.ndarray): Nx2 coordinates of the input points, one region per input point.
+        vertices (numpy.ndarray): Mx2 coordinates of the Voronoi vertices.
+        region_offsets (numpy.ndarray): CSR offsets, the vertices of region i are region_vertices[region_offsets[i]:region_offsets[i+1]].
+        region_vertices (numpy.ndarray): Vertex indices of all regions, concatenated.
+        adjacency_offsets (numpy.ndarray): CSR offsets, the neighbours of region i are adjacency[adjacency_offsets[i]:adjacency_offsets[i+1]].
+        adjacency (numpy.ndarray): Indices of neighbouring regions of all regions, concatenated.
+        tree (scipy.spatial.cKDTree): KD-tree of the input points, used for nearest neighbour region selection.
+    """
+
+    def __init__(self, vor):
+        """
+        Args:
+            vor (scipy.spatial.qhull.Voronoi): Bounded Voronoi diagram, see TrackGenerator.bounded_voronoi.
+        """
+        self.vor = vor
+        self.points = np.asarray(vor.filtered_points)
+        self.vertices = vor.vertices
+        n_points = len(self.points)
+
+        # Regions of the input points in CSR format
+        regions = vor.filtered_regions
+        lengths = np.fromiter((len(region) for region in regions), dtype=np.intp, count=n_points)
+        self.region_offsets = np.concatenate([[0], np.cumsum(lengths)])
+        self.region_vertices = np.fromiter((vertex for region in regions for vertex in region), dtype=np.intp, count=self.region_offsets[-1])
+
+        # Two regions are neighbours if they share a ridge, ridges with mirrored points are left out
+        ridge_points = vor.ridge_points[(vor.ridge_points < n_points).all(axis=1)]
+        pairs = np.concatenate([ridge_points, ridge_points[:, ::-1]])
+        pairs = pairs[np.argsort(pairs[:, 0], kind='stable')]
+        self.adjacency_offsets = np.searchsorted(pairs[:, 0], np.arange(n_points + 1))
+        self.adjacency = pairs[:, 1]
+
+        # Spatial index of the input points
+        self.tree = spatial.cKDTree(self.points)
+
+    def region(self, point_index):
+        """
+        Returns the vertex indices of the region belonging to an input point.
+
+        Args:
+            point_index (int): Index of the input point.
+
+        Returns:
+            numpy.ndarray: Vertex indices of the region.
+        """
+        return self.region_vertices[self.region_offsets[point_index]:self.region_offsets[point_index + 1]]
+
+    def neighbours(self, point_index):
+        """
+        Returns the indices of the regions that share an edge with the region of an input point.
+
+        Args:
+            point_index (int): Index of the input point.
+
+        Returns:
+            numpy.ndarray: Indices of the neighbouring regions.
+        """
+        return self.adjacency[self.adjacency_offsets[point_index]:self.adjacency_offsets[point_index + 1]]
+
+    def region_vertex_indices(self, point_indices):
+        """
+        Returns the unique vertex indices of the regions belonging to a set of input points.
+
+        Args:
+            point_indices (numpy.ndarray): Indices of the input points.
+
+        Returns:
+            numpy.ndarray: Unique vertex indices of the regions.
+        """
+        point_indices = np.asarray(point_indices)
+        starts = self.region_offsets[point_indices]
+        lengths = self.region_offsets[point_indices + 1] - starts
+
+        # Gather all CSR ranges at once
+        shifts = starts - np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        flat_indices = np.repeat(shifts, lengths) + np.arange(lengths.sum())
+        return np.unique(self.region_vertices[flat_indices])
+
+    def region_vertex_coordinates(self, point_indices):
+        """
+        Returns the unique vertex coordinates of the regions belonging to a set of input points.
+
+        Args:
+            point_indices (numpy.ndarray): Indices of the input points.
+
+        Returns:
+            numpy.ndarray: Coordinates of the unique vertices of the regions.
+        """
+        return self.vertices[self.region_vertex_indices(point_indices)]
+
+class LazyVoronoiIndex:
+    """
+    Voronoi regions of a large set of input points, computed on demand from a Delaunay triangulation.
+    The vertices of a region are the circumcentres of the triangles around its input point, so only the regions
+    that are selected are ever computed. Only input points close to the bounding box edges are mirrored.
+    If a selected region reaches beyond the bounding box or is open, the mirrored margin was too small and the
+    triangulation is rebuilt with a wider margin, so the regions are the same as those of the fully mirrored diagram.
+
+    Attributes:
+        points (numpy.ndarray): Nx2 coordinates of the input points, one region per input point.
+        bounding_box (numpy.ndarray): Boundaries of the diagram, [x_min, x_max, y_min, y_max].
+        margin (float): Distance from the edges within which input points are mirrored.
+    """
+
+    def __init__(self, points, bounding_box, margin=None):
+        """
+        Args:
+            points (numpy.ndarray): Nx2 coordinates of the input points.
+            bounding_box (numpy.ndarray): Boundaries of the diagram, [x_min, x_max, y_min, y_max].
+            margin (float): Distance from the edges within which input points are mirrored.
+                If None, four times the mean distance between input points is used.
+        """
+        self.points = np.asarray(points)
+        self.bounding_box = np.asarray(bounding_box, dtype=float)
+        x_min, x_max, y_min, y_max = self.bounding_box
+        if margin is None:
+            margin = 4 * np.sqrt((x_max - x_min) * (y_max - y_min) / len(self.points))
+        self._tree = None
+        self._triangulate(margin)
+
+    @property
+    def tree(self):
+        """
+        scipy.spatial.cKDTree: KD-tree of the input points, built on first use.
+        """
+        if self._tree is None:
+            self._tree = spatial.cKDTree(self.points)
+        return self._tree
+
+    def _triangulate(self, margin):
+        """
+        Triangulates the input points and their mirror images within the margin of each edge.
+        """
+        self.margin = margin
+        x_min, x_max, y_min, y_max = self.bounding_box
+        mirrored = [self.points]
+        for boundary, axis in ((x_min, 0), (x_max, 0), (y_min, 1), (y_max, 1)):
+            near = self.points[np.abs(self.points[:, axis] - boundary) < margin]
+            near = near.copy()
+            near[:, axis] = 2 * boundary - near[:, axis]
+            mirrored.append(near)
+        self._delaunay = spatial.Delaunay(np.concatenate(mirrored))
+
+        # Triangles around every input point in CSR format
+        n_points = len(self.points)
+        corners = self._delaunay.simplices.ravel()
+        order = np.argsort(corners, kind='stable')
+        self._triangle_offsets = np.searchsorted(corners[order], np.arange(n_points + 1))
+        self._triangles = order[:self._triangle_offsets[-1]] // 3
+
+        # Input points on the convex hull have open regions
+        self._on_hull = np.zeros(n_points, dtype=bool)
+        hull_points = np.unique(self._delaunay.convex_hull)
+        self._on_hull[hull_points[hull_points < n_points]] = True
+
+    def region_vertex_coordinates(self, point_indices):
+        """
+        Returns the unique vertex coordinates of the regions belonging to a set of input points.
+
+        Args:
+            point_indices (numpy.ndarray): Indices of the input points.
+
+        Returns:
+            numpy.ndarray: Coordinates of the unique vertices of the regions.
+        """
+        point_indices = np.unique(point_indices)
+        x_min, x_max, y_min, y_max = self.bounding_box
+        tolerance = 1e-9 * max(x_max - x_min, y_max - y_min)
+
+        while True:
+            starts = self._triangle_offsets[point_indices]
+            lengths = self._triangle_offsets[point_indices + 1] - starts
+            shifts = starts - np.concatenate([[0], np.cumsum(lengths)[:-1]])
+            triangles = np.unique(self._triangles[np.repeat(shifts, lengths) + np.arange(lengths.sum())])
+            vertices = circumcentres(self._delaunay.points[self._delaunay.simplices[triangles]])
+
+            # Regions within the bounding box are exact, otherwise widen the mirrored margin
+            inside = ((vertices[:, 0] >= x_min - tolerance) & (vertices[:, 0] <= x_max + tolerance) &
+                      (vertices[:, 1] >= y_min - tolerance) & (vertices[:, 1] <= y_max + tolerance))
+            if (inside.all() and not self._on_hull[point_indices].any()) or self.margin >= max(x_max - x_min, y_max - y_min):
+                break
+            self._triangulate(2 * self.margin)
+
+        # Mirrored triangles share circumcentres on the edges, merge vertices that coincide
+        return np.unique(np.round(vertices / tolerance) * tolerance, axis=0)
+
+def circumcentres(triangles):
+    """
+    Calculates the centres of the circumscribed circles of triangles.
+
+    Args:
+        triangles (numpy.ndarray): Nx3x2 coordinates of the corners of the triangles.
+
+    Returns:
+        numpy.ndarray: Nx2 coordinates of the circumcentres.
+    """
+    a = triangles[:, 0]
+    b = triangles[:, 1] - a
+    c = triangles[:, 2] - a
+    d = 2 * (b[:, 0] * c[:, 1] - b[:, 1] * c[:, 0])
+    b_squared = (b ** 2).sum(axis=1)
+    c_squared = (c ** 2).sum(axis=1)
+    ux = (c[:, 1] * b_squared - b[:, 1] * c_squared) / d
+    uy = (b[:, 0] * c_squared - c[:, 0] * b_squared) / d
+    return a + np.column_stack([ux, uy])
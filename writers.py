@@ -0,0 +1,265 @@
+import io, json, os, shutil, tempfile, zipfile
+import numpy as np
+import yaml
+from utils import SimType, local_to_geodetic
+from dataset import TrackDatasetWriter
+
+# Registered output formats, maps a key (SimType or str) to a (writer function, file extension) pair
+WRITERS = {}
+
+# Output formats that can hold many tracks in a single file, maps a key to a stream class, see register_stream
+STREAMS = {}
+
+def register_writer(key, extension):
+    """
+    Registers an output format. Used as decorator on a writer function.
+    The writer function is called as writer(outfile, cones_left, cones_right, metadata), with a text file object,
+    Nx2 numpy arrays of the left and right cone coordinates and a dictionary with metadata of the track.
+    The metadata contains the centreline of the track as Nx2 numpy array under 'centreline', if it is known.
+
+    Args:
+        key (SimType or str): Key to select the output format with.
+        extension (str): File extension of the output format, without dot.
+
+    Returns:
+        function: Decorator that registers the writer function.
+    """
+    def decorator(writer):
+        WRITERS[key] = (writer, extension)
+        return writer
+    return decorator
+
+def register_stream(key):
+    """
+    Registers a class that writes many tracks to a single file in an output format. Used as decorator on the class.
+    The class is created with the path of the file, and must have write(cones_left, cones_right, metadata) and close() methods.
+
+    Args:
+        key (SimType or str): Key of the output format, must also be registered with register_writer.
+
+    Returns:
+        function: Decorator that registers the stream class.
+    """
+    def decorator(stream):
+        STREAMS[key] = stream
+        return stream
+    return decorator
+
+class TrackWriter:
+    """
+    Writes tracks to files in a directory or to entries in a zip archive, one track at a time.
+    File names are created from a template which is formatted with the track metadata and the index of the track,
+    e.g. 'random_track_{seed}' or 'track_{index:05d}'.
+    Formats with a registered stream (GPX and GeoJSON) can also write all tracks to a single file, by passing a path with their extension.
+    With SimType.DATASET all tracks are appended to the binary dataset in the directory instead.
+    """
+
+    def __init__(self, sim_type, location, name='random_track'):
+        """
+        Args:
+            sim_type (SimType or str): Output format, must be registered with register_writer or be SimType.DATASET.
+            location (str): Directory to write the files or the dataset to, path of a zip archive if it ends with '.zip',
+                or path of a single file if it ends with the extension of a format with a registered stream.
+            name (str): Template of the file name, without extension.
+        """
+        self._location = location
+        self._name = name
+        self._index = 0
+        self._archive = None
+        self._dataset = None
+        self._stream = None
+
+        if sim_type == SimType.DATASET:
+            self._dataset = TrackDatasetWriter(location)
+            return
+        if sim_type not in WRITERS:
+            raise ValueError("No writer registered for output format {}.".format(sim_type))
+        self._writer, self._extension = WRITERS[sim_type]
+        if location.endswith('.zip'):
+            self._archive = zipfile.ZipFile(location, 'a', compression=zipfile.ZIP_DEFLATED)
+        elif sim_type in STREAMS and location.endswith('.' + self._extension):
+            self._stream = STREAMS[sim_type](location)
+
+    def write(self, cones_left, cones_right, metadata=None):
+        """
+        Writes a single track.
+
+        Args:
+            cones_left (numpy.ndarray): Nx2 numpy array of left cone coordinates.
+            cones_right (numpy.ndarray): Nx2 numpy array of right cone coordinates.
+            metadata (dict): Metadata of the track, used for the file name and by the writer.
+
+        Returns:
+            str: Path of the written file, name of the entry in the zip archive, or directory of the dataset or path of the single file.
+        """
+        metadata = metadata or {}
+        if self._dataset is not None:
+            self._dataset.append(cones_left, cones_right, metadata)
+            return self._location
+        if self._stream is not None:
+            self._stream.write(np.asarray(cones_left), np.asarray(cones_right), metadata)
+            return self._location
+
+        file_name = self._name.format(index=self._index, **metadata) + '.' + self._extension
+        self._index += 1
+        cones_left, cones_right = np.asarray(cones_left), np.asarray(cones_right)
+
+        if self._archive is not None:
+            with self._archive.open(file_name, 'w') as entry, io.TextIOWrapper(entry, encoding='utf-8', newline='') as outfile:
+                self._writer(outfile, cones_left, cones_right, metadata)
+            return file_name
+
+        track_file_name = os.path.join(self._location, file_name)
+        with open(track_file_name, 'w') as outfile:
+            self._writer(outfile, cones_left, cones_right, metadata)
+        return track_file_name
+
+    def close(self):
+        if self._archive is not None:
+            self._archive.close()
+        if self._dataset is not None:
+            self._dataset.close()
+        if self._stream is not None:
+            self._stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+@register_writer(SimType.FSSIM, 'yaml')
+def write_fssim(outfile, cones_left, cones_right, metadata):
+    """
+    Writes an FSSIM compatible yaml track file.
+    """
+    data = dict()
+    data['cones_left'] = cones_left.astype(float).round(6).tolist()
+    data['cones_right'] = cones_right.astype(float).round(6).tolist()
+    data['cones_orange'] = []
+    data['cones_orange_big'] = [[4.7, 2.5], [4.7, -2.5], [7.3, 2.5], [7.3, -2.5]]
+    data['starting_pose_cg'] = [0., 0., 0.]
+    data['tk_device'] = [[6., 3.], [6., -3.]]
+    data['seed'] = metadata.get('seed')
+    yaml.dump(data, outfile)
+
+@register_writer(SimType.FSDS, 'csv')
+def write_fsds(outfile, cones_left, cones_right, metadata):
+    """
+    Writes an FSDS compatible csv track file.
+    The format has no room for metadata, use a file name template with the seed to record it.
+    """
+    np.savetxt(outfile, cones_left, fmt='blue,%.6f,%.6f,0,0.01,0.01,0')
+    np.savetxt(outfile, cones_right, fmt='yellow,%.6f,%.6f,0,0.01,0.01,0')
+    outfile.write("big_orange,4.7,2.2,0,0.01,0.01,0\n")
+    outfile.write("big_orange,4.7,-2.2,0,0.01,0.01,0\n")
+    outfile.write("big_orange,7.3,2.2,0,0.01,0.01,0\n")
+    outfile.write("big_orange,7.3,-2.2,0,0.01,0.01,0\n")
+
+def _geodetic(points, metadata):
+    """
+    Converts an Nx2 array of local coordinates to an Nx3 array of latitude, longitude and elevation,
+    using the lat_offset, lon_offset and z_offset metadata as origin.
+    """
+    lat, lon = local_to_geodetic(points, metadata.get('lat_offset', 0), metadata.get('lon_offset', 0))
+    return np.column_stack([lat, lon, np.full(len(lat), float(metadata.get('z_offset', 0)))])
+
+# Metadata that is written as properties of the GeoJSON features
+_PROPERTIES = ('seed', 'mode', 'n_points', 'n_regions')
+
+def _gpx_waypoints(outfile, cones_left, cones_right, metadata):
+    """
+    Writes the cones as GPX waypoints, named after the side of the track.
+    """
+    for side, cones in (('left', cones_left), ('right', cones_right)):
+        np.savetxt(outfile, _geodetic(cones, metadata), fmt='  <wpt lat="%.9f" lon="%.9f"><ele>%.3f</ele><name>' + side + '</name></wpt>')
+
+def _gpx_track(outfile, centreline, metadata):
+    """
+    Writes the centreline as a GPX track with a single segment.
+    """
+    outfile.write('  <trk>\n    <name>seed={}</name>\n    <trkseg>\n'.format(metadata.get('seed')))
+    np.savetxt(outfile, _geodetic(centreline, metadata), fmt='      <trkpt lat="%.9f" lon="%.9f"><ele>%.3f</ele></trkpt>')
+    outfile.write('    </trkseg>\n  </trk>\n')
+
+_GPX_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n<gpx xmlns="http://www.topografix.com/GPX/1/1" version="1.1" creator="random-track-generator">\n'
+
+@register_writer(SimType.GPX, 'gpx')
+def write_gpx(outfile, cones_left, cones_right, metadata):
+    """
+    Writes the cones as waypoints and the centreline as track of a GPX file, using the lat_offset, lon_offset and z_offset metadata as origin.
+    """
+    outfile.write(_GPX_HEADER)
+    outfile.write('  <metadata><desc>seed={}</desc></metadata>\n'.format(metadata.get('seed')))
+    _gpx_waypoints(outfile, cones_left, cones_right, metadata)
+    if metadata.get('centreline') is not None:
+        _gpx_track(outfile, metadata['centreline'], metadata)
+    outfile.write('</gpx>\n')
+
+@register_stream(SimType.GPX)
+class GPXStream:
+    """
+    Writes many tracks to a single GPX file. GPX requires all waypoints before all tracks, so the waypoints are
+    written to the file directly and the tracks are spilled to a temporary file, which is appended on close.
+    """
+
+    def __init__(self, path):
+        self._outfile = open(path, 'w')
+        self._tracks = tempfile.TemporaryFile('w+')
+        self._outfile.write(_GPX_HEADER)
+
+    def write(self, cones_left, cones_right, metadata):
+        _gpx_waypoints(self._outfile, cones_left, cones_right, metadata)
+        if metadata.get('centreline') is not None:
+            _gpx_track(self._tracks, metadata['centreline'], metadata)
+
+    def close(self):
+        self._tracks.seek(0)
+        shutil.copyfileobj(self._tracks, self._outfile)
+        self._tracks.close()
+        self._outfile.write('</gpx>\n')
+        self._outfile.close()
+
+def _geojson_features(cones_left, cones_right, metadata):
+    """
+    Returns the GeoJSON features of a track: the left and right cones as MultiPoints and the centreline as LineString.
+    Coordinates are longitude, latitude and elevation.
+    """
+    properties = {name: metadata[name] for name in _PROPERTIES if name in metadata}
+    geometries = [('cones_left', 'MultiPoint', cones_left), ('cones_right', 'MultiPoint', cones_right)]
+    if metadata.get('centreline') is not None:
+        geometries.append(('centreline', 'LineString', metadata['centreline']))
+
+    features = []
+    for name, geometry_type, points in geometries:
+        coordinates = _geodetic(points, metadata)[:, [1, 0, 2]].round(9).tolist()
+        features.append({'type': 'Feature', 'geometry': {'type': geometry_type, 'coordinates': coordinates},
+                         'properties': dict(properties, feature=name)})
+    return features
+
+@register_writer(SimType.GEOJSON, 'geojson')
+def write_geojson(outfile, cones_left, cones_right, metadata):
+    """
+    Writes the cones and the centreline as a GeoJSON FeatureCollection, using the lat_offset, lon_offset and z_offset metadata as origin.
+    """
+    json.dump({'type': 'FeatureCollection', 'features': _geojson_features(cones_left, cones_right, metadata)}, outfile)
+
+@register_stream(SimType.GEOJSON)
+class GeoJSONStream:
+    """
+    Writes many tracks to a single GeoJSON FeatureCollection, one feature per line.
+    """
+
+    def __init__(self, path):
+        self._outfile = open(path, 'w')
+        self._outfile.write('{"type": "FeatureCollection", "features": [\n')
+        self._first = True
+
+    def write(self, cones_left, cones_right, metadata):
+        for feature in _geojson_features(cones_left, cones_right, metadata):
+            self._outfile.write(('' if self._first else ',\n') + json.dumps(feature))
+            self._first = False
+
+    def close(self):
+        self._outfile.write('\n]}\n')
+        self._outfile.close()